@@ -1,13 +1,18 @@
 import os
 import shutil
+import asyncio
 import uuid
+import aiofiles
 from typing import List
 from datetime import datetime
 
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Query, Response
+from celery import group
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy import case, or_, and_, update, delete, select
 from sqlalchemy.sql import func
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, TypeAdapter, field_serializer
 
 from app.database.connection import get_db
 from app.config import settings
@@ -16,39 +21,80 @@ from app.models.user import User
 from app.models.audit import AuditLog
 from app.models.faq import FAQ
 from app.utils.security import get_current_admin
-from app.services.pdf_processor import PDFProcessor
-from app.services.embedding_service import EmbeddingService
-from app.services.vector_db import VectorDBService
-from app.services.cache_service import CacheService
+from app.services.vector_db import VectorDBService, get_vector_service
+from app.services.cache_service import CacheService, get_cache_service
 from app.services.startup_processor import run_startup_processing
+from app.services.faq_cache import invalidate_faq_cache
+from app.tasks.pdf_tasks import process_pdf_task
 from app.utils.encryption import encrypt_id, decrypt_id
 
 router = APIRouter()
 
+UPLOAD_CHUNK_SIZE = 64 * 1024  # 64 KB per read while streaming uploads to disk
+
+def _dispatch_failed(db: Session, pdf_ids: list[int], error: Exception) -> HTTPException:
+    """
+    The broker refused the job(s): mark the rows 'error' instead of leaving them
+    'processing' forever, and hand back the 503 to raise.
+    """
+    print(f"Could not queue PDF processing for {pdf_ids}: {error}")
+    db.rollback()
+    db.execute(update(PDFDocument).where(PDFDocument.id.in_(pdf_ids)).values(status="error"))
+    db.commit()
+    return HTTPException(status_code=503, detail="Processing queue is unavailable. Please try again later.")
+
+def _existing_files(paths) -> set[str]:
+    """
+    Returns which of the given file paths exist, listing each parent directory
+    once with os.scandir instead of stat()ing every file individually.
+    """
+    present = set()
+    for directory in {os.path.dirname(p) for p in paths}:
+        try:
+            with os.scandir(directory) as entries:
+                present.update(entry.path for entry in entries if entry.is_file())
+        except FileNotFoundError:
+            continue
+    return present
+
+def _json_list(adapter: TypeAdapter, rows) -> Response:
+    """
+    Validates ORM rows and serializes the whole list in a single pydantic-core
+    pass, instead of letting FastAPI re-validate each row one by one.
+    """
+    items = adapter.validate_python(rows, from_attributes=True)
+    return Response(content=adapter.dump_json(items), media_type="application/json")
+
 # =======================
 # 1. SCHEMAS
 # =======================
 
 class AuditLogResponse(BaseModel):
-    id: str  # Encrypted ID
+    id: int  # Encrypted on output
     question: str
     answer: str
     created_at: datetime
     response_time_ms: float
-    
-    class Config:
-        from_attributes = True
+
+    model_config = ConfigDict(from_attributes=True, extra="ignore")
+
+    @field_serializer("id")
+    def _encrypt_id(self, value: int) -> str:
+        return encrypt_id(value)
 
 class UserResponse(BaseModel):
-    id: str  # Encrypted ID
+    id: int  # Encrypted on output
     email: str
     full_name: str | None
     role: str
     is_active: bool
     created_at: datetime
-    
-    class Config:
-        from_attributes = True
+
+    model_config = ConfigDict(from_attributes=True, extra="ignore")
+
+    @field_serializer("id")
+    def _encrypt_id(self, value: int) -> str:
+        return encrypt_id(value)
 
 class UserRoleUpdate(BaseModel):
     role: str  # e.g., "admin" or "viewer"
@@ -64,121 +110,134 @@ class FAQUpdate(BaseModel):
     language: str | None = None
 
 class FAQResponse(BaseModel):
-    id: str  # Encrypted ID
+    id: int  # Encrypted on output
     question: str
     answer: str
     language: str
-    product_id: str  # Encrypted ID
+    product_id: int  # Encrypted on output
     created_at: datetime
-    
-    class Config:
-        from_attributes = True
 
-# =======================
-# 2. BACKGROUND TASKS
-# =======================
+    model_config = ConfigDict(from_attributes=True, extra="ignore")
 
-def process_pdf_background(file_path: str, product_name: str, pdf_db_id: int, db: Session):
-    """
-    Extracts text, generates embeddings, and stores vectors in ChromaDB.
-    """
-    try:
-        # 1. Extract Text
-        processor = PDFProcessor()
-        text = processor.extract_text(file_path)
-        chunks = processor.create_chunks(text, {"source": os.path.basename(file_path)})
-        
-        # 2. Generate Embeddings
-        embed_service = EmbeddingService()
-        texts = [c["text"] for c in chunks]
-        embeddings = embed_service.generate_batch_document_embeddings(texts)
-        
-        # 3. Store in Vector DB (Global Collection)
-        vector_service = VectorDBService()
-        
-        # Create unique IDs for ChromaDB
-        ids = [f"{product_name}_{pdf_db_id}_{i}" for i in range(len(chunks))]
-        metadatas = [c["metadata"] for c in chunks]
-        
-        # Pass product_name so it gets stamped on every chunk's metadata
-        vector_service.add_documents(
-            product_name=product_name, 
-            documents=texts,
-            metadatas=metadatas,
-            ids=ids,
-            embeddings=embeddings
-        )
-        
-        # 4. Update Database Status to 'completed'
-        pdf_record = db.query(PDFDocument).filter(PDFDocument.id == pdf_db_id).first()
-        if pdf_record:
-            pdf_record.status = "completed"
-            pdf_record.chunk_count = len(chunks)
-            db.commit()
-            
-    except Exception as e:
-        print(f"Error processing PDF: {e}")
-        # Mark as error in DB
-        pdf_record = db.query(PDFDocument).filter(PDFDocument.id == pdf_db_id).first()
-        if pdf_record:
-            pdf_record.status = "error"
-            db.commit()
+    @field_serializer("id", "product_id")
+    def _encrypt_ids(self, value: int) -> str:
+        return encrypt_id(value)
+
+class PDFDocumentResponse(BaseModel):
+    id: int  # Encrypted on output
+    product_id: int  # Encrypted on output
+    file_name: str
+    file_size: int | None
+    language: str | None
+    status: str
+    chunk_count: int | None
+    uploaded_at: datetime | None
+
+    model_config = ConfigDict(from_attributes=True, extra="ignore")
+
+    @field_serializer("id", "product_id")
+    def _encrypt_ids(self, value: int) -> str:
+        return encrypt_id(value)
+
+# Whole-list (de)serializers, built once at import
+AuditLogListAdapter = TypeAdapter(List[AuditLogResponse])
+UserListAdapter = TypeAdapter(List[UserResponse])
+FAQListAdapter = TypeAdapter(List[FAQResponse])
+PDFDocumentListAdapter = TypeAdapter(List[PDFDocumentResponse])
 
 # =======================
-# 3. PDF MANAGEMENT ROUTES
+# 2. PDF MANAGEMENT ROUTES
 # =======================
 
 @router.post("/upload-pdf")
 async def upload_pdf(
-    background_tasks: BackgroundTasks,
     encrypted_product_id: str = Form(...),
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_admin)
 ):
     product_id = decrypt_id(encrypted_product_id)
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
+    # Only the name is needed; a plain string can't be expired by the later commit
+    product_name = db.execute(select(Product.name).where(Product.id == product_id)).scalar_one_or_none()
+    if product_name is None:
         raise HTTPException(status_code=404, detail="Product not found")
 
     # Security: Validate content type
     if file.content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="Invalid file type. Only PDFs are allowed.")
 
-    # Security: Read file with a size limit to prevent large file attacks
-    contents = await file.read(settings.MAX_FILE_SIZE + 1)
-    if len(contents) > settings.MAX_FILE_SIZE:
-        raise HTTPException(status_code=413, detail=f"File size exceeds the limit of {settings.MAX_FILE_SIZE // 1024 // 1024}MB.")
-
-    # Security: Check for PDF magic number (%PDF)
-    if not contents.startswith(b'%PDF-'):
-        raise HTTPException(status_code=400, detail="File is not a valid PDF.")
-
     upload_dir = os.path.join(settings.PDF_UPLOAD_DIR, str(product_id))
     os.makedirs(upload_dir, exist_ok=True)
     
     unique_filename = f"{uuid.uuid4()}.pdf"
     file_path = os.path.join(upload_dir, unique_filename)
     
-    with open(file_path, "wb") as buffer:
-        buffer.write(contents)
-        
-    new_pdf = PDFDocument(
-        product_id=product_id,
-        file_name=file.filename,
-        file_path=file_path,
-        file_size=len(contents),
-        status="processing"
+    # The multipart body is already spooled, so the size is known before writing
+    size_limit_error = HTTPException(status_code=413, detail=f"File size exceeds the limit of {settings.MAX_FILE_SIZE // 1024 // 1024}MB.")
+    file_size = file.size
+    if file_size is not None and file_size > settings.MAX_FILE_SIZE:
+        raise size_limit_error
+
+    # Security: Check the PDF magic number (%PDF) before touching disk or DB
+    first_chunk = await file.read(UPLOAD_CHUNK_SIZE)
+    if not first_chunk.startswith(b'%PDF-'):
+        raise HTTPException(status_code=400, detail="File is not a valid PDF.")
+
+    async def _write_file() -> int:
+        # Stream to disk in fixed-size chunks so memory stays constant
+        written = 0
+        async with aiofiles.open(file_path, "wb") as buffer:
+            chunk = first_chunk
+            while chunk:
+                written += len(chunk)
+                if written > settings.MAX_FILE_SIZE:
+                    raise size_limit_error
+                await buffer.write(chunk)
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        return written
+
+    def _insert_pdf_row() -> int:
+        new_pdf = PDFDocument(
+            product_id=product_id,
+            file_name=file.filename,
+            file_path=file_path,
+            file_size=file_size,
+            status="processing"
+        )
+        db.add(new_pdf)
+        db.flush()  # Assigns the id; no refresh round-trip after commit
+        pdf_id = new_pdf.id
+        db.commit()
+        return pdf_id
+
+    # The row doesn't depend on the file contents, so overlap disk IO with the insert
+    written, pdf_id = await asyncio.gather(
+        _write_file(), asyncio.to_thread(_insert_pdf_row), return_exceptions=True
     )
-    db.add(new_pdf)
-    db.commit()
-    db.refresh(new_pdf)
+    if isinstance(pdf_id, BaseException):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise pdf_id
+    if isinstance(written, BaseException):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        db.execute(delete(PDFDocument).where(PDFDocument.id == pdf_id))
+        db.commit()
+        raise written
+    if file_size is None:
+        db.execute(update(PDFDocument).where(PDFDocument.id == pdf_id).values(file_size=written))
+        db.commit()
     
-    background_tasks.add_task(process_pdf_background, file_path, product.name, new_pdf.id, db)
+    try:
+        process_pdf_task.delay(file_path, product_name, pdf_id)
+    except Exception as e:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise _dispatch_failed(db, [pdf_id], e)
     
-    return {"message": "File uploaded and processing started", "pdf_id": encrypt_id(new_pdf.id)}
+    return {"message": "File uploaded and processing started", "pdf_id": encrypt_id(pdf_id)}
 
-@router.get("/pdfs/{encrypted_product_id}")
+@router.get("/pdfs/{encrypted_product_id}", response_model=List[PDFDocumentResponse])
 def list_pdfs(
     encrypted_product_id: str, 
     db: Session = Depends(get_db),
@@ -187,7 +246,7 @@ def list_pdfs(
     """List all PDFs associated with a product."""
     product_id = decrypt_id(encrypted_product_id)
     pdfs = db.query(PDFDocument).filter(PDFDocument.product_id == product_id).all()
-    return pdfs
+    return _json_list(PDFDocumentListAdapter, pdfs)
 
 @router.get("/products/{encrypted_product_id}/pdfs/{encrypted_pdf_id}/status")
 def get_pdf_status(
@@ -241,30 +300,40 @@ def delete_pdf(
 @router.post("/products/{encrypted_product_id}/reprocess-pdfs")
 def reprocess_pdfs(
     encrypted_product_id: str, 
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_admin)
 ):
     """Triggers reprocessing of ALL PDFs for a specific product."""
     product_id = decrypt_id(encrypted_product_id)
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
+    product_name = db.execute(select(Product.name).where(Product.id == product_id)).scalar_one_or_none()
+    if product_name is None:
         raise HTTPException(status_code=404, detail="Product not found")
         
-    pdfs = db.query(PDFDocument).filter(PDFDocument.product_id == product_id).all()
-    
-    count = 0
-    for pdf in pdfs:
-        if os.path.exists(pdf.file_path):
-            pdf.status = "processing"
-            background_tasks.add_task(process_pdf_background, pdf.file_path, product.name, pdf.id, db)
-            count += 1
+    # Only the two columns we need; statuses are set with one bulk UPDATE below
+    pdfs = db.query(PDFDocument.id, PDFDocument.file_path).filter(PDFDocument.product_id == product_id).all()
     
+    present = _existing_files(pdf.file_path for pdf in pdfs)
+    to_process = [pdf for pdf in pdfs if pdf.file_path in present]
+    if not to_process:
+        return {"message": "Reprocessing triggered for 0 PDFs"}
+
+    db.execute(
+        update(PDFDocument)
+        .where(PDFDocument.id.in_([pdf.id for pdf in to_process]))
+        .values(status="processing")
+    )
+    # Commit before dispatch so workers never see a stale status
     db.commit()
-    return {"message": f"Reprocessing triggered for {count} PDFs"}
+    try:
+        group(
+            process_pdf_task.s(pdf.file_path, product_name, pdf.id) for pdf in to_process
+        ).apply_async()
+    except Exception as e:
+        raise _dispatch_failed(db, [pdf.id for pdf in to_process], e)
+    return {"message": f"Reprocessing triggered for {len(to_process)} PDFs"}
 
 # =======================
-# 4. FAQ MANAGEMENT
+# 3. FAQ MANAGEMENT
 # =======================
 
 @router.post("/products/{encrypted_product_id}/pre-faq", response_model=FAQResponse)
@@ -276,10 +345,8 @@ def add_pre_faq(
 ):
     """Add a manually managed FAQ to the database."""
     product_id = decrypt_id(encrypted_product_id)
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
 
+    # No separate product lookup: the products FK rejects unknown IDs on INSERT
     new_faq = FAQ(
         product_id=product_id,
         question=faq_data.question,
@@ -287,16 +354,17 @@ def add_pre_faq(
         language=faq_data.language
     )
     db.add(new_faq)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        # Only the products FK means "no such product"; other constraint failures propagate
+        if "FOREIGN KEY" not in str(e.orig).upper():
+            raise
+        raise HTTPException(status_code=404, detail="Product not found")
+    invalidate_faq_cache()
     db.refresh(new_faq)
-    return FAQResponse(
-        id=encrypt_id(new_faq.id),
-        question=new_faq.question,
-        answer=new_faq.answer,
-        language=new_faq.language,
-        product_id=encrypt_id(new_faq.product_id),
-        created_at=new_faq.created_at
-    )
+    return new_faq
 
 @router.get("/products/{encrypted_product_id}/pre-faq", response_model=List[FAQResponse])
 def get_pre_faqs(
@@ -305,17 +373,11 @@ def get_pre_faqs(
 ):
     """Get all FAQs for a product (Public or Admin)."""
     product_id = decrypt_id(encrypted_product_id)
-    faqs = db.query(FAQ).filter(FAQ.product_id == product_id).all()
-    return [
-        FAQResponse(
-            id=encrypt_id(f.id),
-            question=f.question,
-            answer=f.answer,
-            language=f.language,
-            product_id=encrypt_id(f.product_id),
-            created_at=f.created_at
-        ) for f in faqs
-    ]
+    faqs = db.execute(
+        select(FAQ.id, FAQ.question, FAQ.answer, FAQ.language, FAQ.product_id, FAQ.created_at)
+        .where(FAQ.product_id == product_id)
+    ).all()
+    return _json_list(FAQListAdapter, faqs)
 
 @router.put("/products/{encrypted_product_id}/pre-faq/{encrypted_faq_id}", response_model=FAQResponse)
 def update_pre_faq(
@@ -338,15 +400,9 @@ def update_pre_faq(
     if faq_data.language: faq.language = faq_data.language
     
     db.commit()
+    invalidate_faq_cache()
     db.refresh(faq)
-    return FAQResponse(
-        id=encrypt_id(faq.id),
-        question=faq.question,
-        answer=faq.answer,
-        language=faq.language,
-        product_id=encrypt_id(faq.product_id),
-        created_at=faq.created_at
-    )
+    return faq
 
 @router.delete("/products/{encrypted_product_id}/pre-faq/{encrypted_faq_id}")
 def delete_pre_faq(
@@ -365,51 +421,73 @@ def delete_pre_faq(
     
     db.delete(faq)
     db.commit()
+    invalidate_faq_cache()
     return {"message": "FAQ deleted successfully"}
 
 # =======================
-# 5. AUDIT & LOGS
+# 4. AUDIT & LOGS
 # =======================
 
 @router.get("/audit", response_model=List[AuditLogResponse])
 def get_audit_logs(
-    limit: int = 100, 
+    limit: int = Query(100, ge=1),
+    cursor: str | None = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_admin)
 ):
-    """Retrieve latest chat history/audit logs."""
-    logs = db.query(AuditLog).order_by(AuditLog.created_at.desc()).limit(limit).all()
-    return [
-        AuditLogResponse(
-            id=encrypt_id(log.id),
-            question=log.question,
-            answer=log.answer,
-            created_at=log.created_at,
-            response_time_ms=log.response_time_ms
-        ) for log in logs
-    ]
+    """
+    Retrieve the latest `limit` chat history/audit logs, newest first (as before).
+    Older pages: pass the X-Next-Cursor response header back as ?cursor=
+    (keyset pagination, no OFFSET scans).
+    """
+    # Plain rows of just the response columns; no ORM objects to hydrate
+    stmt = select(
+        AuditLog.id, AuditLog.question, AuditLog.answer, AuditLog.created_at, AuditLog.response_time_ms
+    )
+    if cursor:
+        cursor_id = decrypt_id(cursor)
+        anchor = select(AuditLog.created_at).where(AuditLog.id == cursor_id).scalar_subquery()
+        # (created_at, id) is the sort key, so ties on created_at are not skipped
+        stmt = stmt.where(or_(
+            AuditLog.created_at < anchor,
+            and_(AuditLog.created_at == anchor, AuditLog.id < cursor_id),
+        ))
+    logs = db.execute(stmt.order_by(AuditLog.created_at.desc(), AuditLog.id.desc()).limit(limit)).all()
+    response = _json_list(AuditLogListAdapter, logs)
+    if len(logs) == limit:
+        response.headers["X-Next-Cursor"] = encrypt_id(logs[-1].id)
+    return response
 
 # =======================
-# 6. USER MANAGEMENT
+# 5. USER MANAGEMENT
 # =======================
 
 @router.get("/users", response_model=List[UserResponse])
 def list_users(
+    limit: int | None = Query(None, ge=1, le=500),
+    cursor: str | None = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_admin)
 ):
-    """List all registered users."""
-    users = db.query(User).all()
-    return [
-        UserResponse(
-            id=encrypt_id(user.id),
-            email=user.email,
-            full_name=user.full_name,
-            role=user.role,
-            is_active=user.is_active,
-            created_at=user.created_at
-        ) for user in users
-    ]
+    """
+    List registered users in id order. Without ?limit= all users are returned (the
+    admin Users tab relies on that); with it, pages are keyset-paginated like /audit:
+    pass the X-Next-Cursor header back as ?cursor=.
+    """
+    # Only the columns the response needs (never the password hash)
+    stmt = select(
+        User.id, User.email, User.full_name, User.role, User.is_active, User.created_at
+    )
+    if cursor:
+        stmt = stmt.where(User.id > decrypt_id(cursor))
+    stmt = stmt.order_by(User.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    users = db.execute(stmt).all()
+    response = _json_list(UserListAdapter, users)
+    if limit is not None and len(users) == limit:
+        response.headers["X-Next-Cursor"] = encrypt_id(users[-1].id)
+    return response
 
 @router.put("/users/{encrypted_user_id}/role", response_model=UserResponse)
 def update_user_role(
@@ -432,17 +510,11 @@ def update_user_role(
         raise HTTPException(status_code=400, detail="You cannot demote yourself.")
 
     user_to_update.role = role_data.role
+    # Snapshot before commit: commit expires the instance and reading it back would re-SELECT
+    updated = UserResponse.model_validate(user_to_update)
     db.commit()
-    db.refresh(user_to_update)
     
-    return UserResponse(
-        id=encrypt_id(user_to_update.id),
-        email=user_to_update.email,
-        full_name=user_to_update.full_name,
-        role=user_to_update.role,
-        is_active=user_to_update.is_active,
-        created_at=user_to_update.created_at
-    )
+    return updated
     
 # Other routes remain the same...
 @router.post("/startup/reload")
@@ -460,15 +532,21 @@ def get_cache_stats(
     current_user: User = Depends(get_current_admin)
 ):
     """Returns statistics about chatbot usage and cache performance."""
-    total_requests = db.query(AuditLog).count()
-    cache_hits = db.query(AuditLog).filter(AuditLog.is_cached == True).count()
+    # One scan / one round trip for all three aggregates
+    total_requests, cache_hits, avg_time = db.execute(
+        select(
+            func.count(),
+            func.sum(case((AuditLog.is_cached == True, 1), else_=0)),
+            func.avg(AuditLog.response_time_ms),
+        ).select_from(AuditLog)
+    ).one()
+    cache_hits = cache_hits or 0
+    avg_time = avg_time or 0
     cache_misses = total_requests - cache_hits
     
     hit_rate = 0
     if total_requests > 0:
         hit_rate = round((cache_hits / total_requests) * 100, 2)
-        
-    avg_time = db.query(func.avg(AuditLog.response_time_ms)).scalar() or 0
     
     return {
         "total_requests": total_requests,
@@ -479,16 +557,20 @@ def get_cache_stats(
     }
 
 @router.delete("/cache/semantic")
-def clear_semantic_cache(current_user: User = Depends(get_current_admin)):
+def clear_semantic_cache(
+    service: VectorDBService = Depends(get_vector_service),
+    current_user: User = Depends(get_current_admin)
+):
     """Wipes the Semantic Cache (ChromaDB Q&A collection)."""
-    service = VectorDBService()
     service.clear_semantic_cache()
     return {"message": "Semantic cache (Q&A) cleared successfully"}
 
 @router.delete("/cache/redis")
-def clear_redis_cache(current_user: User = Depends(get_current_admin)):
+def clear_redis_cache(
+    service: CacheService = Depends(get_cache_service),
+    current_user: User = Depends(get_current_admin)
+):
     """Wipes the Redis Cache (Rate limits, etc)."""
-    service = CacheService()
     if not service.enabled:
         raise HTTPException(status_code=400, detail="Redis is not enabled")
     service.clear_all()
@@ -497,6 +579,7 @@ def clear_redis_cache(current_user: User = Depends(get_current_admin)):
 @router.delete("/knowledge-base/clear")
 def clear_knowledge_base(
     db: Session = Depends(get_db),
+    service: VectorDBService = Depends(get_vector_service),
     current_user: User = Depends(get_current_admin)
 ):
     """
@@ -504,15 +587,14 @@ def clear_knowledge_base(
     The chatbot will forget all PDF content until reprocessed.
     """
     # 1. Wipe Vector DB
-    service = VectorDBService()
     service.clear_knowledge_base()
     
-    # 2. Reset PDF status in DB
-    pdfs = db.query(PDFDocument).filter(PDFDocument.status == "completed").all()
-    for pdf in pdfs:
-        pdf.status = "uploaded" # Reset to uploaded (needs processing)
-        pdf.chunk_count = 0
-    
+    # 2. Reset PDF status in DB (one UPDATE, no rows loaded into Python)
+    db.execute(
+        update(PDFDocument)
+        .where(PDFDocument.status == "completed")
+        .values(status="uploaded", chunk_count=0) # Reset to uploaded (needs processing)
+    )
     db.commit()
     
     return {"message": "Knowledge base cleared. PDFs marked for reprocessing."}
\ No newline at end of file
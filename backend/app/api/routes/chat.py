@@ -1,26 +1,28 @@
 # app/api/routes/chat.py
 import time
-import json
 import re
 import asyncio
+import uuid
+import hashlib
+import numpy as np
+import orjson
 from fastapi import APIRouter, Depends, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 
 
-from app.models.product import Product
 from app.database.connection import get_db
-from app.services.embedding_service import EmbeddingService
-from app.services.vector_db import VectorDBService
-from app.services.llm_service import LLMService
-from app.services.cache_service import CacheService
-from app.models.audit import AuditLog
-from app.models.faq import FAQ
-from app.models.product import Product
+from app.services.embedding_service import EmbeddingService, get_embedding_service
+from app.services.vector_db import VectorDBService, get_vector_service
+from app.services.llm_service import LLMService, get_llm_service
+from app.services.reranker import RerankerService, get_reranker_service
+from app.services.cache_service import CacheService, get_cache_service, split_for_stream
+from app.services.faq_cache import get_manual_faq
+from app.services.product_cache import get_products, find_product_names
+from app.services.audit_queue import enqueue_audit, write_audit_batch
 from app.utils.limiter import limiter
-from app.utils.language_detector import detect_language
+from app.utils.language_detector import detect_session_language
 
 router = APIRouter()
 
@@ -44,26 +46,227 @@ class SuggestionResponse(BaseModel):
     questions: list[str]
 
 # --- HELPER: AUDIT LOGGING ---
-def _log_audit(db: Session, question: str, answer: str, lang: str, time_ms: float, cached: bool, debug_note: str):
+def _log_audit(question: str, answer: str, lang: str, time_ms: float, cached: bool, debug_note: str):
+    record = dict(
+        question=question, 
+        answer=answer[:5000], 
+        language=lang, 
+        response_time_ms=time_ms, 
+        is_cached=cached, 
+        sources=debug_note
+    )
+    # Batched by the background writer; off the request's critical path.
+    # Without a writer (startup/shutdown) the row is inserted on a worker thread instead
+    if not enqueue_audit(record):
+        _in_background(write_audit_batch, [record])
+
+# --- HELPER: CACHE-HIT RESPONSE ---
+def _cached_response(answer: str, sources: list, lang: str, elapsed: float, layer: str) -> ChatResponse:
+    return ChatResponse(
+        answer=answer, sources=sources, response_time=elapsed,
+        cached=True, detected_language=lang, debug_info=layer
+    )
+
+# --- HELPER: PRODUCT DETECTION ---
+async def _detect_product(db: Session, product_id: str | None, text_lower: str) -> str | None:
+    """Product name from an explicit id, else the first product mentioned in the (lowercased) text."""
+    if product_id and product_id.isdigit():
+        pid = int(product_id)
+        for p_id, name, _ in await get_products(db):
+            if p_id == pid: return name
+    mentioned = await find_product_names(db, text_lower)
+    return mentioned[0] if mentioned else None
+
+# --- HELPER: CACHE WRITE-BACK ---
+def _save_answer(cache_service: CacheService, vector_service: VectorDBService, product_context: str, lang: str,
+                 search_query: str, query_emb, session_id: str, question: str, answer: str, sources: list):
+    """Stores a fresh RAG answer in Redis and the semantic cache, and records the turn. Blocking; run in a thread."""
+    cache_service.set_qa_cache(product_context, lang, search_query, answer, sources)
+    vector_service.cache_answer(search_query, answer, sources, query_emb)
+    cache_service.add_turn(session_id, question, answer)
+
+# --- HELPER: BACKGROUND WRITES ---
+_background_tasks: set[asyncio.Task] = set()  # Strong refs so pending writes aren't garbage-collected
+
+def _on_background_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Background write error: {task.exception()}")
+
+def _in_background(fn, *args):
+    """Runs a blocking cache/history write on a worker thread without the response waiting for it."""
+    task = asyncio.create_task(asyncio.to_thread(fn, *args))
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_done)
+
+# --- HELPER: SPECULATIVE EMBEDDING ---
+def _start_query_embedding(embed_service: EmbeddingService, text: str) -> asyncio.Task:
+    """
+    Embeds text on a worker thread so the model runs while Redis answers.
+    Callers that hit a cache layer simply never await the task.
+    """
+    task = asyncio.create_task(asyncio.to_thread(embed_service.generate_query_embedding, text))
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())  # Unawaited failures stay quiet
+    return task
+
+def _embed_early(cache_service: CacheService, session_id: str | None, product_context: str, lang: str,
+                 q_norm: str, q_lower: str, intent_keywords: tuple) -> bool:
+    """
+    Whether to embed the question while Redis answers. Not when a cheaper path is already
+    known to answer it (an intent, or a QA entry in process memory), nor for a follow-up
+    that will be rewritten and embedded anyway; those embed on demand if they fall through.
+    """
+    if any(keyword in q_lower for keyword in intent_keywords):
+        return False
+    if session_id and _FOLLOWUP_RE.search(q_norm):
+        return False
+    return not cache_service.has_local_qa(product_context, lang, q_norm)
+
+async def _query_embedding(task: asyncio.Task | None, embed_service: EmbeddingService, text: str):
+    """The speculative embedding if one was started, else embeds text now."""
+    if task is None:
+        return await asyncio.to_thread(embed_service.generate_query_embedding, text)
+    return await task
+
+# --- HELPER: KEYWORD RE-RANKING ---
+# Compiled once; boilerplate and broken-font (cid) chunks are pushed down the ranking.
+# Chroma only filters chunks that are mostly boilerplate; ones that merely contain a footer
+# or a few cid artifacts (and chunks ingested before tagging) are ranked down here.
+# One alternation, one pass per chunk: group 1 = boilerplate (-20), group 2 = cid artifacts (-10).
+_NEGATIVE_RE = re.compile(r'(disclaimer|regd\. office)|(\(cid:)', re.IGNORECASE)
+_HAS_DIGIT = re.compile(r'\d').search
+
+def _negative_score(chunk: str) -> int:
+    boilerplate = cid = False
+    for m in _NEGATIVE_RE.finditer(chunk):
+        if m.lastindex == 1: boilerplate = True
+        else: cid = True
+        if boilerplate and cid: break
+    return 20 * boilerplate + 10 * cid
+
+# Intent keywords and LLM failure markers, built once instead of per request
+_SUMMARY_KW = ("various plans", "all plans", "list plans", "types of insurance", "what plans")
+_ASK_SUMMARY_KW = _SUMMARY_KW + ("compare plans",)  # /ask has no comparison intent
+_COMPARE_KW = ("compare", "vs", "versus", "difference between")
+_LLM_ERROR_PHRASES = ("I apologize", "Error generating", "internal error")
+
+# Follow-ups that lean on earlier turns (pronouns, "what about ...") need the LLM rewrite;
+# self-contained questions are searched as asked, even mid-conversation
+_FOLLOWUP_RE = re.compile(
+    r"\b(it|its|that|this|these|those|they|them|their|he|she|his|her)\b|^(and|also|what about|how about)\b",
+    re.IGNORECASE,
+)
+
+# Chunks are "Section: ...\nContent: <text>"; duplicates are judged on the
+# first 200 chars of the text, so the same clause from two PDFs/pages is only sent to the LLM once
+_CONTENT_MARKER = "Content: "
+_DEDUPE_PREFIX_CHARS = 200
+
+def _dedupe_key(chunk: str) -> bytes:
+    body = chunk.split(_CONTENT_MARKER, 1)[-1]
+    return hashlib.blake2b(body[:_DEDUPE_PREFIX_CHARS].encode(), digest_size=8).digest()
+
+# Vector hits fed to the re-ranker; mostly-boilerplate chunks are already filtered out in Chroma
+_RAG_CANDIDATES = 10
+# Keyword-ranked candidates passed on to the cross-encoder
+_CROSS_ENCODE_POOL = 6
+
+def _rerank_chunks(search_query: str, raw_chunks: list, raw_metas: list, k: int = 3,
+                   reranker: RerankerService | None = None):
+    """
+    Two-stage re-rank of vector hits: cheap keyword scoring narrows them to a small pool,
+    then the cross-encoder (when enabled) picks the top-k. Returns (chunks, metas).
+    """
+    keywords = [w.lower() for w in search_query.split() if len(w) > 3]
+    n = len(raw_chunks)
+    lowered = [c.lower() for c in raw_chunks]  # Lowercased once, not once per keyword
+
+    # One int32 score per chunk, accumulated feature by feature
+    scores = np.zeros(n, dtype=np.int32)
+    for kw in keywords:
+        scores += 10 * np.fromiter((kw in c for c in lowered), dtype=np.int32, count=n)
+    scores += 5 * np.fromiter((_HAS_DIGIT(c) is not None for c in raw_chunks), dtype=np.int32, count=n)
+    scores -= np.fromiter((_negative_score(c) for c in raw_chunks), dtype=np.int32, count=n)
+
+    # Highest score first; a stable argsort keeps vector-rank order on ties.
+    # Walk that order keeping only the best-ranked copy of duplicated text.
+    limit = _CROSS_ENCODE_POOL if reranker else k
+    seen, kept = set(), []
+    for i in np.argsort(-scores, kind="stable"):
+        key = _dedupe_key(raw_chunks[i])
+        if key in seen: continue
+        seen.add(key); kept.append(i)
+        if len(kept) == limit: break
+    top = np.array(kept, dtype=np.intp)
+    if reranker and len(top) > k:
+        top = top[reranker.rank_indices(search_query, [raw_chunks[i] for i in top], k)]
+    return [raw_chunks[i] for i in top], [raw_metas[i] for i in top]
+
+# --- HELPER: NDJSON FRAMING ---
+# Frames are encoded straight to bytes with orjson; token frames (one per LLM
+# token) only encode the token string between fixed prefix/suffix bytes.
+_TOKEN_PREFIX = b'{"type":"token","content":'
+_FRAME_END = b'}\n'
+
+def _token_frame(text: str) -> bytes:
+    return _TOKEN_PREFIX + orjson.dumps(text) + _FRAME_END
+
+def _frame(payload: dict) -> bytes:
+    return orjson.dumps(payload) + b"\n"
+
+_ACK_FRAME = b'{"type":"ack"}\n'  # Sent first; clients ignore unknown frame types
+
+# --- HELPER: STREAM COALESCING ---
+STREAM_FLUSH_BYTES = 4096
+STREAM_FLUSH_SECONDS = 0.02
+
+async def _coalesce_ndjson(lines):
+    """
+    Groups ndjson lines into fewer, larger body chunks (fewer ASGI sends).
+    Flushes once ~4 KB is buffered or the oldest buffered line is 20 ms old,
+    even while the producer is still waiting on its next token.
+    """
+    loop = asyncio.get_running_loop()
+    lines = lines.__aiter__()
+    buf, size, deadline = [], 0, None
+    pending = None
     try:
-        log = AuditLog(
-            question=question, 
-            answer=answer[:5000], 
-            language=lang, 
-            response_time_ms=time_ms, 
-            is_cached=cached, 
-            sources=debug_note
-        )
-        db.add(log)
-        db.commit()
-    except Exception as e:
-        print(f"Audit Log Error: {e}")
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(lines.__anext__())
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            done, _ = await asyncio.wait((pending,), timeout=timeout)
+            if not done:
+                # Producer is slow: don't hold tokens back past the window
+                yield b"".join(buf)
+                buf, size, deadline = [], 0, None
+                continue
+
+            task, pending = pending, None
+            try:
+                line = task.result()
+            except StopAsyncIteration:
+                break
+            except Exception:
+                if buf: yield b"".join(buf)
+                raise
+
+            buf.append(line); size += len(line)
+            if deadline is None:
+                deadline = loop.time() + STREAM_FLUSH_SECONDS
+            if size >= STREAM_FLUSH_BYTES or loop.time() >= deadline:
+                yield b"".join(buf)
+                buf, size, deadline = [], 0, None
+        if buf:
+            yield b"".join(buf)
+    finally:
+        if pending is not None:
+            pending.cancel()
 
 # --- ROUTES ---
 
 @router.get("/suggestions", response_model=SuggestionResponse)
-def get_chat_suggestions():
-    vector_service = VectorDBService()
+def get_chat_suggestions(vector_service: VectorDBService = Depends(get_vector_service)):
     questions = vector_service.get_all_cached_questions(limit=10)
     return SuggestionResponse(questions=questions)
 
@@ -75,147 +278,141 @@ def get_chat_suggestions():
 async def ask_question(
     request: Request,
     body: ChatRequest, 
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    cache_service: CacheService = Depends(get_cache_service),
+    embed_service: EmbeddingService = Depends(get_embedding_service),
+    vector_service: VectorDBService = Depends(get_vector_service),
+    llm_service: LLMService = Depends(get_llm_service),
+    reranker: RerankerService | None = Depends(get_reranker_service)
 ):
     start_time = time.time()
     
     # 1. SETUP
-    detected_lang = body.language if body.language and body.language != "auto" else detect_language(body.question)
-    session_id = body.session_id if body.session_id else f"temp_{int(time.time())}"
-
-    cache_service = CacheService()
-    embed_service = EmbeddingService()
-    vector_service = VectorDBService()
-    llm_service = LLMService()
+    q_norm = body.question.strip(); q_lower = q_norm.lower()  # Normalized once, shared by every layer
+    if body.language and body.language != "auto":
+        detected_lang = body.language
+    else:
+        # Reuse the session's language after the first reliable detection
+        detected_lang = detect_session_language(body.session_id, q_norm)
+    session_id = body.session_id or f"temp_{uuid.uuid4().hex}"  # Unique per anonymous request
 
     # 2. CONTEXTUALIZATION & PRODUCT DETECTION
-    history = cache_service.get_history(session_id)
-    search_query = llm_service.contextualize_query(history, body.question)
-
-    target_product_name = None
+    # History and the exact-match QA entry come back in one Redis round trip. The QA
+    # lookup is keyed on the raw question, which is the search query unless it gets rewritten,
+    # so that question is embedded in parallel for the semantic/RAG layers (unless a manual
+    # FAQ, an intent or an in-memory QA entry will answer first).
+    target_product_name = await _detect_product(db, body.product_id, q_lower)
+    manual_answer = None
     if body.product_id and body.product_id.isdigit():
-        prod = db.query(Product).filter(Product.id == int(body.product_id)).first()
-        if prod: target_product_name = prod.name
-    
-    if not target_product_name:
-        all_products = db.query(Product).all()
-        for p in all_products:
-            if p.name.lower() in search_query.lower():
-                target_product_name = p.name; break
+        manual_answer = await get_manual_faq(db, int(body.product_id), q_lower)
+    emb_task = None
+    if manual_answer is None and _embed_early(cache_service, body.session_id, target_product_name or "global",
+                                              detected_lang, q_norm, q_lower, _ASK_SUMMARY_KW):
+        emb_task = _start_query_embedding(embed_service, q_norm)
+    history, precheck_qa = await asyncio.to_thread(
+        cache_service.get_precheck, session_id, target_product_name or "global", detected_lang, q_norm
+    )
+    # First turn or self-contained follow-up: nothing to resolve, so no LLM rewrite
+    needs_rewrite = bool(history) and _FOLLOWUP_RE.search(q_norm) is not None
+    search_query = await llm_service.contextualize_query(history, q_norm) if needs_rewrite else q_norm
+    rewritten = search_query != q_norm
+    query_lower = search_query.lower() if rewritten else q_lower
+    if rewritten:
+        target_product_name = await _detect_product(db, body.product_id, query_lower)
     
     product_context = target_product_name or "global"
     
     # 3. INTENT RECOGNITION (Handle "list all plans" type questions)
-    summary_keywords = ["various plans", "all plans", "list plans", "compare plans", "types of insurance", "what plans"]
-    if any(keyword in search_query.lower() for keyword in summary_keywords):
-        all_products = db.query(Product).all()
+    if any(keyword in query_lower for keyword in _ASK_SUMMARY_KW):
+        all_products = await get_products(db)
         if not all_products:
             summary_answer = "I don't have information on any specific plans right now."
         else:
-            product_names = [f"'{p.name}'" for p in all_products]
+            product_names = [f"'{name}'" for _, name, _ in all_products]
             summary_answer = f"I have information on the following plans: {', '.join(product_names)}. Which one would you like to know more about?"
         
         elapsed = time.time() - start_time
-        cache_service.add_to_history(session_id, "user", body.question)
-        cache_service.add_to_history(session_id, "assistant", summary_answer)
-        _log_audit(db, search_query, summary_answer, detected_lang, elapsed, False, "Summary Intent")
+        await asyncio.to_thread(cache_service.add_turn, session_id, body.question, summary_answer)
+        _log_audit(search_query, summary_answer, detected_lang, elapsed, False, "Summary Intent")
         return ChatResponse(
             answer=summary_answer, sources=["System"], response_time=elapsed, cached=False,
             detected_language=detected_lang, debug_info="Intent: Summary"
         )
 
     # 4. CACHING LAYERS (0, 1, 2)
-    # Layer 0: Manual FAQ
-    if body.product_id and body.product_id.isdigit():
-        manual_faq = db.query(FAQ).filter(FAQ.product_id == int(body.product_id), func.lower(FAQ.question) == body.question.lower().strip()).first()
-        if manual_faq:
-            # ... (return cached response)
-            pass
+    # Layer 0: Manual FAQ (looked up above)
+    if manual_answer:
+        elapsed = time.time() - start_time
+        await asyncio.to_thread(cache_service.add_turn, session_id, body.question, manual_answer)
+        _log_audit(search_query, manual_answer, detected_lang, elapsed, True, "Manual FAQ")
+        return _cached_response(manual_answer, ["Official FAQ"], detected_lang, elapsed, "Layer 0: Manual FAQ")
 
     # Layer 1: Redis
-    redis_data = cache_service.get_qa_cache(product_context, detected_lang, search_query)
+    query_emb = None
+    if rewritten:
+        # Rewritten query needs its own lookup; embed it meanwhile so a miss doesn't wait on the model
+        redis_data, query_emb = await asyncio.gather(
+            asyncio.to_thread(cache_service.get_qa_cache, product_context, detected_lang, search_query),
+            asyncio.to_thread(embed_service.generate_query_embedding, search_query),
+        )
+    else:
+        redis_data = precheck_qa
     if redis_data:
-        # ... (return cached response)
-        pass
+        elapsed = time.time() - start_time
+        await asyncio.to_thread(cache_service.add_turn, session_id, body.question, redis_data["answer"])
+        _log_audit(search_query, redis_data["answer"], detected_lang, elapsed, True, "Redis Hit")
+        return _cached_response(redis_data["answer"], redis_data["sources"], detected_lang, elapsed, "Layer 1: Redis Hit")
     
     # Layer 2: Semantic
-    query_emb = embed_service.generate_query_embedding(search_query)
-    has_numbers = bool(re.search(r'\d', search_query))
-    if not has_numbers and not history:
-        semantic_hit = vector_service.search_cache(query_emb, threshold=0.20)
+    if query_emb is None:
+        query_emb = await _query_embedding(emb_task, embed_service, q_norm)  # Not rewritten: search query is the question
+    if not history and not _HAS_DIGIT(search_query):
+        semantic_hit = await asyncio.to_thread(vector_service.search_cache, query_emb, threshold=0.20)
         if semantic_hit:
-
-            # ... (return cached response)
-            pass
-
-    # 5. LAYER 3: RAG PIPELINE (WITH RE-RANKING)
-    # A. Retrieve Broadly
-    search_results = vector_service.search(query_emb, n_results=15, product_filter=target_product_name)
-
             elapsed = time.time() - start_time
-            # Update History
-            cache_service.add_to_history(session_id, "user", body.question)
-            cache_service.add_to_history(session_id, "assistant", semantic_hit["answer"])
-            
-            # Promote to Redis
-            cache_service.set_qa_cache(product_context, detected_lang, search_query, semantic_hit["answer"], semantic_hit["sources"])
-            
-            _log_audit(db, search_query, semantic_hit["answer"], detected_lang, elapsed, True, "Semantic Hit")
-            return ChatResponse(
-                answer=semantic_hit["answer"], sources=semantic_hit["sources"], response_time=elapsed,
-                cached=True, detected_language=detected_lang, debug_info=f"Layer 2: Semantic Hit"
+            # Update History + Promote to Redis
+            await asyncio.gather(
+                asyncio.to_thread(cache_service.add_turn, session_id, body.question, semantic_hit["answer"]),
+                asyncio.to_thread(cache_service.set_qa_cache, product_context, detected_lang, search_query, semantic_hit["answer"], semantic_hit["sources"]),
             )
-    # 6. LAYER 3: RAG PIPELINE (Deep Search)
-    # --------------------------------------
-    # Use n_results=2 for Hardware Optimization
-    # Filter by product_name if specified, otherwise search all products
-    search_results = vector_service.search(query_emb, n_results=2, product_name=product_name)
+            
+            _log_audit(search_query, semantic_hit["answer"], detected_lang, elapsed, True, "Semantic Hit")
+            return _cached_response(semantic_hit["answer"], semantic_hit["sources"], detected_lang, elapsed, "Layer 2: Semantic Hit")
+
+    # 5. LAYER 3: RAG PIPELINE (WITH RE-RANKING)
+    # A. Retrieve Broadly (one Chroma query, scoped to the detected product if any)
+    search_results = await asyncio.to_thread(vector_service.search, query_emb, n_results=_RAG_CANDIDATES, product_filter=target_product_name)
 
-    
     if not search_results['documents'] or not search_results['documents'][0]:
         elapsed = time.time() - start_time
-        _log_audit(db, search_query, "No info found", detected_lang, elapsed, False, "Empty Search")
+        _log_audit(search_query, "No info found", detected_lang, elapsed, False, "Empty Search")
         return ChatResponse(
             answer="I couldn't find relevant information in any of our policies.", sources=[],
             response_time=elapsed, cached=False, detected_language=detected_lang, debug_info="Layer 3: No Docs"
         )
     
-    # B. Keyword Re-Ranking
-    raw_chunks = search_results['documents'][0]
-    raw_metas = search_results['metadatas'][0]
-    keywords = [w.lower() for w in search_query.split() if len(w) > 3]
-    
-    scored_chunks = []
-    for i, chunk in enumerate(raw_chunks):
-        score = sum(10 for kw in keywords if kw in chunk.lower())
-        if any(char.isdigit() for char in chunk): score += 5
-        if "disclaimer" in chunk.lower() or "regd. office" in chunk.lower(): score -= 20
-        if "(cid:" in chunk.lower(): score -= 10
-        scored_chunks.append({"text": chunk, "meta": raw_metas[i], "score": score, "original_rank": i})
-        
-    scored_chunks.sort(key=lambda x: (x["score"], -x["original_rank"]), reverse=True)
-    
-    final_chunks = [x["text"] for x in scored_chunks[:3]]
-    final_metas = [x["meta"] for x in scored_chunks[:3]]
+    # B. Keyword + Cross-Encoder Re-Ranking (model inference off the event loop)
+    final_chunks, final_metas = await asyncio.to_thread(
+        _rerank_chunks, search_query, search_results['documents'][0], search_results['metadatas'][0], 3, reranker
+    )
 
     # C. Generate Answer
-    answer = llm_service.generate_answer(search_query, final_chunks, final_metas, detected_lang, history)
+    answer = await llm_service.generate_answer(search_query, final_chunks, final_metas, detected_lang, history)
     elapsed = time.time() - start_time
 
     # 6. SAVE
-    error_phrases = ["I apologize", "Error generating", "internal error"]
-    is_error = any(phrase in answer for phrase in error_phrases)
+    is_error = any(phrase in answer for phrase in _LLM_ERROR_PHRASES)
     log_status = "LLM Generated"
 
     if not is_error:
-        cache_service.set_qa_cache(product_context, detected_lang, search_query, answer, final_chunks)
-        vector_service.cache_answer(search_query, answer, final_chunks, query_emb)
-        cache_service.add_to_history(session_id, "user", body.question)
-        cache_service.add_to_history(session_id, "assistant", answer)
+        await asyncio.to_thread(
+            _save_answer, cache_service, vector_service, product_context, detected_lang,
+            search_query, query_emb, session_id, body.question, answer, final_chunks
+        )
     else:
         log_status = "LLM Error (Not Cached)"
 
-    _log_audit(db, search_query, answer, detected_lang, elapsed, False, log_status)
+    _log_audit(search_query, answer, detected_lang, elapsed, False, log_status)
     
     return ChatResponse(
         answer=answer, sources=final_chunks, response_time=elapsed, cached=False,
@@ -226,163 +423,172 @@ async def ask_question(
 # 2. STREAMING ENDPOINT (/ask_stream)
 # ----------------------------------------------------
 
-# Add asyncio to your imports at the top of the file
-import asyncio
-
-# ... (keep all other existing imports)
-
 @router.post("/ask_stream")
 @limiter.limit("10/minute") 
 async def ask_question_stream(
     request: Request,
     body: ChatRequest, 
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    cache_service: CacheService = Depends(get_cache_service),
+    embed_service: EmbeddingService = Depends(get_embedding_service),
+    vector_service: VectorDBService = Depends(get_vector_service),
+    llm_service: LLMService = Depends(get_llm_service),
+    reranker: RerankerService | None = Depends(get_reranker_service)
 ):
     start_time = time.time()
     
     # 1. SETUP
-    detected_lang = body.language if body.language and body.language != "auto" else detect_language(body.question)
-    session_id = body.session_id if body.session_id else f"temp_{int(time.time())}"
-    cache_service = CacheService(); embed_service = EmbeddingService(); vector_service = VectorDBService(); llm_service = LLMService()
-
-    # 2. CONTEXTUALIZATION & PRODUCT DETECTION
-    history = cache_service.get_history(session_id)
-    search_query = llm_service.contextualize_query(history, body.question)
-    target_product_name = None
-    if body.product_id and body.product_id.isdigit():
-        prod = db.query(Product).filter(Product.id == int(body.product_id)).first()
-        if prod: target_product_name = prod.name
-    if not target_product_name:
-        all_products = db.query(Product).all()
-        for p in all_products:
-            if p.name.lower() in search_query.lower():
-                target_product_name = p.name; break
-    product_context = target_product_name or "global"
+    q_norm = body.question.strip(); q_lower = q_norm.lower()  # Normalized once, shared by every layer
+    if body.language and body.language != "auto":
+        detected_lang = body.language
+    else:
+        # Reuse the session's language after the first reliable detection
+        detected_lang = detect_session_language(body.session_id, q_norm)
+    session_id = body.session_id or f"temp_{uuid.uuid4().hex}"  # Unique per anonymous request
 
     # --- THE GENERATOR FUNCTION THAT CONTAINS THE CORE LOGIC ---
     async def response_generator():
-        nonlocal start_time, search_query, history, session_id, product_context, detected_lang, target_product_name
+        # First bytes go out before any cache/LLM work, so the client sees the stream open
+        yield _ACK_FRAME
+
+        # 2. CONTEXTUALIZATION & PRODUCT DETECTION (history + QA entry in one round trip,
+        # overlapped with embedding the question for a likely cache miss)
+        target_product_name = await _detect_product(db, body.product_id, q_lower)
+        manual_answer = None
+        if body.product_id and body.product_id.isdigit():
+            manual_answer = await get_manual_faq(db, int(body.product_id), q_lower)
+        emb_task = None
+        if manual_answer is None and _embed_early(cache_service, body.session_id, target_product_name or "global",
+                                                  detected_lang, q_norm, q_lower, _SUMMARY_KW + _COMPARE_KW):
+            emb_task = _start_query_embedding(embed_service, q_norm)
+        history, precheck_qa = await asyncio.to_thread(
+            cache_service.get_precheck, session_id, target_product_name or "global", detected_lang, q_norm
+        )
+        # First turn or self-contained follow-up: nothing to resolve, so no LLM rewrite
+        needs_rewrite = bool(history) and _FOLLOWUP_RE.search(q_norm) is not None
+        search_query = await llm_service.contextualize_query(history, q_norm) if needs_rewrite else q_norm
+        rewritten = search_query != q_norm
+        query_lower = search_query.lower() if rewritten else q_lower
+        if rewritten:
+            target_product_name = await _detect_product(db, body.product_id, query_lower)
+        product_context = target_product_name or "global"
         
         # 3. INTENT RECOGNITION (The Router)
         # ------------------------------------
         # Intent 1: User wants a summary of all plans
-        summary_keywords = ["various plans", "all plans", "list plans", "types of insurance", "what plans"]
-        if any(keyword in search_query.lower() for keyword in summary_keywords):
-            all_products = db.query(Product).all()
-            product_names = [f"'{p.name}'" for p in all_products] if all_products else []
+        if any(keyword in query_lower for keyword in _SUMMARY_KW):
+            product_names = [f"'{name}'" for _, name, _ in await get_products(db)]
             summary_answer = f"I have information on the following plans: {', '.join(product_names)}. Which one would you like to know more about?" if product_names else "I don't have information on any specific plans right now."
             
-            yield json.dumps({"type": "meta", "sources": ["System"], "debug": "Intent: Summary"}) + "\n"
-            tokens = re.split(r'(\s+)', summary_answer)
-            for token in tokens:
-                yield json.dumps({"type": "token", "content": token}) + "\n"
-                await asyncio.sleep(0.01)
+            yield _frame({"type": "meta", "sources": ["System"], "debug": "Intent: Summary"})
+            for piece in split_for_stream(summary_answer):
+                yield _token_frame(piece)
             
-            cache_service.add_to_history(session_id, "user", body.question); cache_service.add_to_history(session_id, "assistant", summary_answer)
-            _log_audit(db, search_query, summary_answer, detected_lang, (time.time()-start_time), False, "Summary Intent")
+            _in_background(cache_service.add_turn, session_id, body.question, summary_answer)
+            _log_audit(search_query, summary_answer, detected_lang, (time.time()-start_time), False, "Summary Intent")
             return
 
         # Intent 2: User wants to compare plans
-        comparison_keywords = ["compare", "vs", "versus", "difference between"]
-        if any(keyword in search_query.lower() for keyword in comparison_keywords):
-            all_products = db.query(Product).all()
-            full_text_to_scan = search_query.lower() + " " + " ".join([h['content'].lower() for h in history])
-            products_to_compare = list(set([p.name for p in all_products if p.name.lower() in full_text_to_scan]))
+        if any(keyword in query_lower for keyword in _COMPARE_KW):
+            full_text_to_scan = query_lower + " " + " ".join([h['content'].lower() for h in history])
+            products_to_compare = await find_product_names(db, full_text_to_scan)
 
             if len(products_to_compare) >= 2:
                 final_chunks, final_metas = [], []
-                for prod_name in products_to_compare[:2]: # Limit to comparing 2 products for performance
-                    comp_query_emb = embed_service.generate_query_embedding(f"Summary of key features for {prod_name}")
-                    search_results = vector_service.search(comp_query_emb, n_results=2, product_filter=prod_name)
+                compared = products_to_compare[:2]  # Limit to comparing 2 products for performance
+                # Both summary queries go through the model as one batch
+                comp_embs = await asyncio.to_thread(embed_service.generate_query_embeddings, [f"Summary of key features for {n}" for n in compared])
+                # One filtered search per product (Chroma has no per-query `where`), run concurrently
+                all_results = await asyncio.gather(*(
+                    asyncio.to_thread(vector_service.search, comp_query_emb, n_results=2, product_filter=prod_name)
+                    for prod_name, comp_query_emb in zip(compared, comp_embs)
+                ))
+                for search_results in all_results:
                     if search_results['documents'] and search_results['documents'][0]:
                         final_chunks.extend(search_results['documents'][0]); final_metas.extend(search_results['metadatas'][0])
                 
                 if final_chunks:
                     comparison_prompt = f"Based on the documents, create a brief comparison of the key features of the '{products_to_compare[0]}' and '{products_to_compare[1]}' plans."
-                    yield json.dumps({"type": "meta", "sources": final_chunks, "debug": f"Intent: Compare"}) + "\n"
+                    yield _frame({"type": "meta", "sources": final_chunks, "debug": "Intent: Compare"})
                     full_response = ""
-                    stream = llm_service.stream_answer(comparison_prompt, final_chunks, final_metas, detected_lang, [])
-                    for token in stream:
+                    async for token in llm_service.stream_answer(comparison_prompt, final_chunks, final_metas, detected_lang, []):
                         full_response += token
-                        yield json.dumps({"type": "token", "content": token}) + "\n"
+                        yield _token_frame(token)
 
-                    _log_audit(db, search_query, full_response, detected_lang, (time.time()-start_time), False, "Comparison Intent")
-                    cache_service.add_to_history(session_id, "user", body.question); cache_service.add_to_history(session_id, "assistant", full_response)
+                    _log_audit(search_query, full_response, detected_lang, (time.time()-start_time), False, "Comparison Intent")
+                    _in_background(cache_service.add_turn, session_id, body.question, full_response)
                     return
 
         # 4. CACHING LAYERS (0, 1, 2)
         # ---------------------------
-        cached_answer = None; source_info = []; debug_msg = ""
-        # Layer 0: Manual FAQ
-        if body.product_id and body.product_id.isdigit():
-            manual_faq = db.query(FAQ).filter(FAQ.product_id == int(body.product_id), func.lower(FAQ.question) == body.question.lower().strip()).first()
-            if manual_faq: cached_answer, source_info, debug_msg = manual_faq.answer, ["Official FAQ"], "Layer 0: Manual FAQ"
+        cached_answer = None; source_info = []; debug_msg = ""; answer_pieces = None
+        # Layer 0: Manual FAQ (looked up above)
+        if manual_answer: cached_answer, source_info, debug_msg = manual_answer, ["Official FAQ"], "Layer 0: Manual FAQ"
 
         # Layer 1: Redis
+        query_emb = None
         if not cached_answer:
-            redis_data = cache_service.get_qa_cache(product_context, detected_lang, search_query)
-            if redis_data: cached_answer, source_info, debug_msg = redis_data["answer"], redis_data["sources"], "Layer 1: Redis Hit"
+            if rewritten:
+                # Rewritten query needs its own lookup; embed it meanwhile so a miss doesn't wait on the model
+                redis_data, query_emb = await asyncio.gather(
+                    asyncio.to_thread(cache_service.get_qa_cache, product_context, detected_lang, search_query),
+                    asyncio.to_thread(embed_service.generate_query_embedding, search_query),
+                )
+            else:
+                redis_data = precheck_qa
+            if redis_data:
+                cached_answer, source_info, debug_msg = redis_data["answer"], redis_data["sources"], "Layer 1: Redis Hit"
+                answer_pieces = redis_data.get("chunks")  # Absent on entries written before pre-splitting
 
         # Layer 2: Semantic
         if not cached_answer:
-            has_numbers = bool(re.search(r'\d', search_query))
-            if not has_numbers and not history:
-                query_emb = embed_service.generate_query_embedding(search_query)
-                semantic_hit = vector_service.search_cache(query_emb, threshold=0.20)
+            if not history and not _HAS_DIGIT(search_query):
+                query_emb = await _query_embedding(emb_task, embed_service, q_norm)
+                semantic_hit = await asyncio.to_thread(vector_service.search_cache, query_emb, threshold=0.20)
                 if semantic_hit: cached_answer, source_info, debug_msg = semantic_hit["answer"], semantic_hit["sources"], "Layer 2: Semantic Hit"
         
         # IF CACHE HIT: Stream it quickly
         if cached_answer:
-            yield json.dumps({"type": "meta", "sources": source_info, "debug": debug_msg}) + "\n"
-            tokens = re.split(r'(\s+)', cached_answer)
-            for token in tokens:
-                yield json.dumps({"type": "token", "content": token}) + "\n"
-                await asyncio.sleep(0.01)
+            yield _frame({"type": "meta", "sources": source_info, "debug": debug_msg})
+            for piece in answer_pieces or split_for_stream(cached_answer):
+                yield _token_frame(piece)
             
-            cache_service.add_to_history(session_id, "user", body.question); cache_service.add_to_history(session_id, "assistant", cached_answer)
-            _log_audit(db, search_query, cached_answer, detected_lang, (time.time()-start_time), True, debug_msg)
+            _in_background(cache_service.add_turn, session_id, body.question, cached_answer)
+            _log_audit(search_query, cached_answer, detected_lang, (time.time()-start_time), True, debug_msg)
             return
 
         # 5. RAG PIPELINE (Layer 3)
         # -------------------------
-        query_emb = embed_service.generate_query_embedding(search_query)
-        search_results = vector_service.search(query_emb, n_results=15, product_filter=target_product_name)
+        if query_emb is None:
+            query_emb = await _query_embedding(emb_task, embed_service, q_norm)  # Not rewritten, so search_query == q_norm
+        search_results = await asyncio.to_thread(vector_service.search, query_emb, n_results=_RAG_CANDIDATES, product_filter=target_product_name)
         
         if not search_results['documents'] or not search_results['documents'][0]:
-            yield json.dumps({"type": "error", "content": "No relevant documents found."}) + "\n"; return
-
-        raw_chunks, raw_metas = search_results['documents'][0], search_results['metadatas'][0]
-        keywords = [w.lower() for w in search_query.split() if len(w) > 3]
-        scored_chunks = []
-        for i, chunk in enumerate(raw_chunks):
-            score = sum(10 for kw in keywords if kw in chunk.lower())
-            if any(char.isdigit() for char in chunk): score += 5
-            if "disclaimer" in chunk.lower() or "regd. office" in chunk.lower(): score -= 20
-            if "(cid:" in chunk.lower(): score -= 10
-            scored_chunks.append({"text": chunk, "meta": raw_metas[i], "score": score, "original_rank": i})
-        scored_chunks.sort(key=lambda x: (x["score"], -x["original_rank"]), reverse=True)
-        final_chunks, final_metas = [x["text"] for x in scored_chunks[:3]], [x["meta"] for x in scored_chunks[:3]]
-
-        yield json.dumps({"type": "meta", "sources": final_chunks, "debug": "Layer 3: Re-Ranked"}) + "\n"
+            yield _frame({"type": "error", "content": "No relevant documents found."}); return
+
+        final_chunks, final_metas = await asyncio.to_thread(
+            _rerank_chunks, search_query, search_results['documents'][0], search_results['metadatas'][0], 3, reranker
+        )
+
+        yield _frame({"type": "meta", "sources": final_chunks, "debug": "Layer 3: Re-Ranked"})
 
         full_response = ""
         try:
-            stream = llm_service.stream_answer(search_query, final_chunks, final_metas, detected_lang, history)
-            for token in stream:
+            async for token in llm_service.stream_answer(search_query, final_chunks, final_metas, detected_lang, history):
                 full_response += token
-                yield json.dumps({"type": "token", "content": token}) + "\n"
+                yield _token_frame(token)
         except Exception as e:
-            yield json.dumps({"type": "error", "content": "Generation failed."}) + "\n"; print(f"Stream Error: {e}"); return
+            yield _frame({"type": "error", "content": "Generation failed."}); print(f"Stream Error: {e}"); return
 
         # Post-Processing & Saving
         elapsed = time.time() - start_time
-        error_phrases = ["I apologize", "Error generating"]
-        if not any(x in full_response for x in error_phrases):
-            cache_service.set_qa_cache(product_context, detected_lang, search_query, full_response, final_chunks)
-            vector_service.cache_answer(search_query, full_response, final_chunks, query_emb)
-            cache_service.add_to_history(session_id, "user", body.question)
-            cache_service.add_to_history(session_id, "assistant", full_response)
+        if not any(x in full_response for x in _LLM_ERROR_PHRASES):
+            # Cache + history writes don't hold back the end of the stream
+            _in_background(
+                _save_answer, cache_service, vector_service, product_context, detected_lang,
+                search_query, query_emb, session_id, body.question, full_response, final_chunks
+            )
             
-        _log_audit(db, search_query, full_response, detected_lang, elapsed, False, "Layer 3: Streamed & Re-Ranked")
+        _log_audit(search_query, full_response, detected_lang, elapsed, False, "Layer 3: Streamed & Re-Ranked")
 
-    return StreamingResponse(response_generator(), media_type="application/x-ndjson")
\ No newline at end of file
+    return StreamingResponse(_coalesce_ndjson(response_generator()), media_type="application/x-ndjson")
\ No newline at end of file
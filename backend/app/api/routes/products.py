@@ -1,16 +1,36 @@
 # app/api/routes/products.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from pydantic import BaseModel, Field
+import asyncio
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import delete, lambda_stmt, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload, selectinload
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List
-from app.database.connection import get_db
+from app.database.connection import get_async_db
 from app.models.product import Product
+from app.models.faq import FAQ
+from app.models.user_product_access import UserProductAccess
 from app.models.user import User
 from app.utils.security import get_current_admin
-from app.utils.encryption import encrypt_id, decrypt_id
+from app.utils.encryption import encrypt_id, encrypt_ids, decrypt_id
+from app.services.product_cache import invalidate_product_cache
+from app.services.faq_cache import invalidate_faq_cache
+from app.services.cache_service import CacheService, get_cache_service
 
 router = APIRouter()
 
+# ProductResponse never touches pdfs/audits: any access is a bug (and an N+1), so make it raise
+_NO_RELATIONS = [raiseload("*")]
+# The list route selects just what ProductResponse serializes (no ORM instances at all)
+_RESPONSE_COLUMNS = (Product.id, Product.name, Product.description)
+# Built once; the lambda's code object is the cache key, so repeat executions skip construction
+_LIST_PRODUCTS = lambda_stmt(lambda: select(Product.id, Product.name, Product.description))
+# Both dialects support INSERT ... ON CONFLICT DO NOTHING ... RETURNING
+_UPSERT_INSERTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
 # --- Schemas ---
 class ProductCreate(BaseModel):
     name: str
@@ -20,27 +40,36 @@ class ProductResponse(BaseModel):
     id: str  # Encrypted ID
     name: str
     description: str | None
-    
-    class Config:
-        from_attributes = True
+
+    model_config = ConfigDict(from_attributes=True, extra="ignore")
+
+def _invalidate_product_caches(cache_service: CacheService):
+    invalidate_product_cache()
+    cache_service.invalidate_products_list()
 
 # --- Routes ---
 
 # 1. CREATE (Protected)
 @router.post("/", response_model=ProductResponse)
-def create_product(
+async def create_product(
     product: ProductCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    cache_service: CacheService = Depends(get_cache_service),
     current_user: User = Depends(get_current_admin)
 ):
-    existing = db.query(Product).filter(Product.name == product.name).first()
-    if existing:
+    # One round-trip, and the unique index settles concurrent creates (no check-then-insert race)
+    insert = _UPSERT_INSERTS[db.bind.dialect.name]
+    stmt = (
+        insert(Product)
+        .values(name=product.name, description=product.description)
+        .on_conflict_do_nothing(index_elements=[Product.name])
+        .returning(*_RESPONSE_COLUMNS)
+    )
+    new_product = (await db.execute(stmt)).first()
+    if new_product is None:
         raise HTTPException(status_code=400, detail="Product already exists")
-    
-    new_product = Product(name=product.name, description=product.description)
-    db.add(new_product)
-    db.commit()
-    db.refresh(new_product)
+    await db.commit()
+    _invalidate_product_caches(cache_service)
     
     return ProductResponse(
         id=encrypt_id(new_product.id),
@@ -50,21 +79,31 @@ def create_product(
 
 # 2. LIST (Public)
 @router.get("/", response_model=List[ProductResponse])
-def list_products(db: Session = Depends(get_db)):
-    products = db.query(Product).all()
-    return [
-        ProductResponse(
-            id=encrypt_id(p.id),
-            name=p.name,
-            description=p.description
-        ) for p in products
-    ]
+async def list_products(
+    db: AsyncSession = Depends(get_async_db),
+    cache_service: CacheService = Depends(get_cache_service)
+):
+    # Hit on every page load: serve the cached JSON body as-is, no DB or validation
+    cached = await asyncio.to_thread(cache_service.get_products_list)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
+    rows = (await db.execute(_LIST_PRODUCTS)).all()
+    # Plain dicts straight to orjson: the columns already match ProductResponse,
+    # so per-row model validation buys nothing here (response_model stays for the docs)
+    payload = orjson.dumps([
+        {"id": encrypted_id, "name": r.name, "description": r.description}
+        for encrypted_id, r in zip(encrypt_ids(r.id for r in rows), rows)
+    ])
+    await asyncio.to_thread(cache_service.set_products_list, payload)
+    return Response(content=payload, media_type="application/json")
 
 # 3. GET ONE (Public)
 @router.get("/{encrypted_product_id}", response_model=ProductResponse)
-def get_product(encrypted_product_id: str, db: Session = Depends(get_db)):
+async def get_product(encrypted_product_id: str, db: AsyncSession = Depends(get_async_db)):
     product_id = decrypt_id(encrypted_product_id)
-    product = db.query(Product).filter(Product.id == product_id).first()
+    # Primary-key fetch: served from the identity map when the row is already in the session
+    product = await db.get(Product, product_id, options=_NO_RELATIONS)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
         
@@ -76,14 +115,15 @@ def get_product(encrypted_product_id: str, db: Session = Depends(get_db)):
 
 # 4. UPDATE (Protected)
 @router.put("/{encrypted_product_id}", response_model=ProductResponse)
-def update_product(
+async def update_product(
     encrypted_product_id: str, 
     product_data: ProductCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    cache_service: CacheService = Depends(get_cache_service),
     current_user: User = Depends(get_current_admin)
 ):
     product_id = decrypt_id(encrypted_product_id)
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id, options=_NO_RELATIONS)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
@@ -91,11 +131,12 @@ def update_product(
     product.description = product_data.description
     
     try:
-        db.commit()
-        db.refresh(product)
+        await db.commit()
     except Exception:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Error updating product. Name might be duplicate.")
+    # Outside the try: the update is committed whatever happens to the caches
+    _invalidate_product_caches(cache_service)
         
     return ProductResponse(
         id=encrypt_id(product.id),
@@ -105,23 +146,31 @@ def update_product(
 
 # 5. DELETE (Protected)
 @router.delete("/{encrypted_product_id}")
-def delete_product(
+async def delete_product(
     encrypted_product_id: str, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    cache_service: CacheService = Depends(get_cache_service),
     current_user: User = Depends(get_current_admin)
 ):
     product_id = decrypt_id(encrypted_product_id)
-    product = db.query(Product).filter(Product.id == product_id).first()
+    # Delete nullifies the children's FKs, so load both collections up front in two queries
+    product = await db.get(
+        Product, product_id, options=[selectinload(Product.pdfs), selectinload(Product.audits)]
+    )
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    # Note: This might fail if there are foreign keys (PDFs, Logs) attached.
-    # In a real app, you would cascade delete or check dependencies.
+    # Manual FAQs and access grants belong to this product alone, so they go with it
+    # (with foreign keys enforced they would otherwise block the delete)
     try:
-        db.delete(product)
-        db.commit()
+        await db.execute(delete(FAQ).where(FAQ.product_id == product_id))
+        await db.execute(delete(UserProductAccess).where(UserProductAccess.product_id == product_id))
+        await db.delete(product)
+        await db.commit()
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Cannot delete product. It may have associated PDFs or Logs.")
+    _invalidate_product_caches(cache_service)
+    invalidate_faq_cache()  # Its FAQs went with it
         
     return {"message": "Product deleted successfully"}
\ No newline at end of file
@@ -1,9 +1,12 @@
 # app/config.py
 import os
+from functools import lru_cache
+from pathlib import Path
 from pydantic_settings import BaseSettings
 
-# Get the project root directory (insurance-faq-chatbot)
-_BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# backend/app/config.py -> backend/ (holds .env) and the project root (insurance-faq-chatbot)
+_BACKEND_DIR = Path(__file__).resolve().parents[1]
+_BASE_DIR = _BACKEND_DIR.parent
 
 class Settings(BaseSettings):
     # App Config
@@ -25,30 +28,60 @@ class Settings(BaseSettings):
         # It's a workaround for how FastAPI handles multithreading.
         return f"sqlite:///{self.SQLITE_DB_FILE}?check_same_thread=False"
 
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        # Same database through an asyncio driver, for routes that use AsyncSession
+        return f"sqlite+aiosqlite:///{self.SQLITE_DB_FILE}"
+
     # Redis
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
+
+    @property
+    def CELERY_BROKER_URL(self) -> str:
+        # Separate Redis DB so flushing the app cache never drops queued jobs
+        return f"redis://{self.REDIS_HOST}:{self.REDIS_PORT}/1"
+
+    @property
+    def RATE_LIMIT_STORAGE_URL(self) -> str:
+        # Shared by every worker process, so per-IP limits hold across workers
+        return f"redis://{self.REDIS_HOST}:{self.REDIS_PORT}/2"
     
     # AI Config
     EMBEDDING_MODEL: str = "intfloat/multilingual-e5-base"
+    EMBEDDING_DEVICE: str | None = None  # None = auto (cuda if available, else cpu)
+    EMBEDDING_BACKEND: str = "torch"  # "torch" (sentence-transformers) or "onnx" (int8 ONNX Runtime, CPU)
+    EMBEDDING_ONNX_DIR: str | None = None  # Exported + quantized model dir, required for the onnx backend
+    EMBEDDING_ONNX_FILE: str = "model_quantized.onnx"
+    EMBEDDING_BATCH_SIZE: int = 64
+    EMBEDDING_CACHE_TTL: int = 60 * 60 * 24 * 30  # 30 days; chunk vectors keyed by content hash
+    RERANKER_ENABLED: bool = True  # Cross-encode the keyword-ranked RAG candidates
+    RERANKER_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
     
     # Groq API Settings - Add your GROQ_API_KEY to a .env file
     GROQ_API_KEY: str 
     GROQ_MODEL: str = "llama-3.1-8b-instant"
+    LLM_MAX_CONCURRENCY: int = 8  # In-flight Groq calls per worker process
     
     # Admin registration key. Change this in production.
     ADMIN_REGISTRATION_KEY: str = "change-this-in-production"
 
     VECTOR_DB_PATH: str = os.path.join(os.getcwd(), "../data/vector_db")
+    CHROMA_BATCH_SIZE: int = 200  # Chunks per upsert during ingestion
     
     # File Paths
-    PDF_UPLOAD_DIR: str = os.path.join(_BASE_DIR, "data/pdfs/uploads")
-    PDF_PRELOAD_DIR: str = os.path.join(_BASE_DIR, "data/pdfs/preload")
+    PDF_UPLOAD_DIR: str = str(_BASE_DIR / "data" / "pdfs" / "uploads")
+    PDF_PRELOAD_DIR: str = str(_BASE_DIR / "data" / "pdfs" / "preload")
 
     # File Uploads
     MAX_FILE_SIZE: int = 1024 * 1024 * 100  # 100 MB
 
     class Config:
-        env_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
+        env_file = _BACKEND_DIR / ".env"
+
+@lru_cache
+def get_settings() -> Settings:
+    """Process-wide Settings; .env is read once (FastAPI dependency-friendly)."""
+    return Settings()
 
-settings = Settings()
\ No newline at end of file
+settings = get_settings()
\ No newline at end of file
@@ -1,14 +1,35 @@
 # app/main.py
+import time
+# Taken before the heavy imports below: a worker only skips the shared startup work
+# if another worker completed it after this process started
+_PROCESS_STARTED = time.time()
+
+import os
+import tempfile
+from contextlib import asynccontextmanager, contextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
 from app.database.connection import engine, Base
 from app.services.startup_processor import run_startup_processing
+from app.services.faq_cache import load_faq_cache
+from app.services.product_cache import load_product_cache
+from app.services.embedding_service import get_embedding_service
+from app.services.reranker import get_reranker_service
+from app.services.audit_queue import start_audit_writer, stop_audit_writer
 from app.database.connection import SessionLocal
 from app.utils.limiter import limiter
+from app.utils.compression import CompressionMiddleware
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded 
 
+# fcntl is POSIX-only; without it every worker simply runs the shared startup work
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 # --- CHANGE START ---
 # Import from the package (app.models) to ensure all classes are registered
 from app.models import Product, PDFDocument, AuditLog 
@@ -16,10 +37,86 @@ from app.models import Product, PDFDocument, AuditLog
 
 from app.api.routes import chat, products, admin , auth
 
-# Create Tables
-Base.metadata.create_all(bind=engine)
+# Held by whichever worker runs the shared (DB-wide) startup work
+STARTUP_LOCK_FILE = os.path.join(tempfile.gettempdir(), "insurance-faq-chatbot.startup.lock")
+# Timestamp of the last successful run of that work
+STARTUP_DONE_FILE = os.path.join(tempfile.gettempdir(), "insurance-faq-chatbot.startup.done")
+
+
+def _startup_done_at() -> float:
+    try:
+        with open(STARTUP_DONE_FILE) as f:
+            return float(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0.0
+
+
+@contextmanager
+def _startup_leader():
+    """
+    Yields True in the one worker that should create tables and ingest preload PDFs,
+    holding the lock for the whole block. Other workers of the same launch wait for
+    it, see the "done" marker written after this process started, and yield False.
+    If the leader's work fails no marker is written, so the next worker retries it.
+    """
+    if fcntl is None:
+        yield True
+        return
+    with open(STARTUP_LOCK_FILE, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            leader = _startup_done_at() < _PROCESS_STARTED
+            yield leader
+            if leader:
+                with open(STARTUP_DONE_FILE, "w") as f:
+                    f.write(str(time.time()))
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def startup_event():
+    print("Starting up...")
+    db = SessionLocal()
+    try:
+        # Shared work: tables + preload ingest, once per launch, under the lock
+        with _startup_leader() as leader:
+            if leader:
+                # Create Tables
+                Base.metadata.create_all(bind=engine)
+                print("Running startup processing...")
+                run_startup_processing(db)
+                print("Startup processing finished.")
+    except Exception as e:
+        print(f"An error occurred during startup processing: {e}")
+        db.rollback()
+    try:
+        # Per-process caches: every worker warms its own, even if the shared work failed
+        load_faq_cache(db)  # Warm Layer 0 so the first chat request skips the load
+        load_product_cache(db)
+        # Load the embedding model now rather than on the first chat request
+        get_embedding_service().warm_up()
+        reranker = get_reranker_service()
+        if reranker is not None:
+            reranker.warm_up()
+    except Exception as e:
+        print(f"An error occurred during startup: {e}")
+        # Optionally, re-raise the exception if you want the app to fail hard
+        # raise e
+    finally:
+        print("Closing startup DB session.")
+        db.close()
+    print("Startup complete.")
+
 
-app = FastAPI(title=settings.APP_NAME)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup_event()
+    start_audit_writer()
+    yield
+    await stop_audit_writer()
+
+
+app = FastAPI(title=settings.APP_NAME, default_response_class=ORJSONResponse, lifespan=lifespan)
 
 origins = [
     "http://localhost:5173",  # Vite Frontend
@@ -36,7 +133,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # Pagination cursor for admin list endpoints
 )
+app.add_middleware(CompressionMiddleware, minimum_size=500)
 
 # Register Routes
 app.include_router(chat.router, prefix="/api/chat", tags=["Chat"])
@@ -45,24 +144,23 @@ app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])       # <-
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 
 
-@app.on_event("startup")
-def startup_event():
-    print("Starting up...")
-    db = SessionLocal()
-    try:
-        print("Running startup processing...")
-        run_startup_processing(db)
-        print("Startup processing finished.")
-    except Exception as e:
-        print(f"An error occurred during startup: {e}")
-        # Optionally, re-raise the exception if you want the app to fail hard
-        # raise e
-    finally:
-        print("Closing startup DB session.")
-        db.close()
-    print("Startup complete.")
-
-
 @app.get("/")
 def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+if __name__ == "__main__":
+    # python -m app.main (from backend/). uvloop + httptools come with uvicorn[standard].
+    # One worker unless WEB_CONCURRENCY says otherwise: each worker loads its own embedding
+    # and re-ranker models, so size it to the host's memory rather than its core count
+    import uvicorn
+
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.environ.get("WEB_CONCURRENCY", 1)),
+        loop="uvloop",
+        http="httptools",
+        limit_concurrency=1000,  # Beyond this, 503 fast instead of queueing into tail latency
+        timeout_keep_alive=30,
+    )
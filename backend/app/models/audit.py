@@ -1,5 +1,5 @@
 # app/models/audit.py
-from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database.connection import Base
@@ -18,4 +18,15 @@ class AuditLog(Base):
     is_cached = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        # Partial index: only cached rows, keeps the cache-hit count cheap
+        Index(
+            "audit_cached_idx", is_cached,
+            postgresql_where=(is_cached == True),
+            sqlite_where=(is_cached == True),
+        ),
+        # Matches the audit listing's ORDER BY for keyset pagination
+        Index("audit_created_at_desc", created_at.desc(), id.desc()),
+    )
+
     product = relationship("Product", back_populates="audits")
\ No newline at end of file
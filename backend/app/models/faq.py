@@ -1,5 +1,5 @@
 # app/models/faq.py
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Index
 from sqlalchemy.sql import func
 from app.database.connection import Base
 
@@ -15,4 +15,9 @@ class FAQ(Base):
     question = Column(Text, nullable=False)
     answer = Column(Text, nullable=False)
     language = Column(String, default="en")
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Expression index for case-insensitive question lookups within a product
+        Index("ix_faq_product_lower_q", product_id, func.lower(question)),
+    )
\ No newline at end of file
@@ -1,5 +1,5 @@
 # app/models/product.py
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database.connection import Base
@@ -8,7 +8,7 @@ class Product(Base):
     __tablename__ = "products"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, unique=True, index=True)
+    name = Column(String)  # Unique; indexed below
     description = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -17,6 +17,12 @@ class Product(Base):
     pdfs = relationship("PDFDocument", back_populates="product")
     audits = relationship("AuditLog", back_populates="product")
 
+    __table_args__ = (
+        # Same unique index as before (backs ON CONFLICT (name)); on Postgres it also
+        # carries id, so name -> id probes are index-only scans
+        Index("ix_products_name", "name", unique=True, postgresql_include=["id"]),
+    )
+
 class PDFDocument(Base):
     __tablename__ = "pdf_documents"
 
@@ -0,0 +1,74 @@
+# app/services/audit_queue.py
+import asyncio
+from app.database.connection import SessionLocal
+from app.models.audit import AuditLog
+
+# Chat requests only enqueue their audit row; a background task writes them
+# in batches so no request waits on an INSERT + commit.
+AUDIT_BATCH_SIZE = 100
+AUDIT_FLUSH_INTERVAL = 0.2  # seconds to wait for a batch to fill
+
+_STOP = object()
+_queue: asyncio.Queue | None = None
+_writer_task: asyncio.Task | None = None
+
+
+def enqueue_audit(record: dict) -> bool:
+    """Queues an AuditLog row (as a dict). Returns False if no writer is running."""
+    if _queue is None:
+        return False
+    _queue.put_nowait(record)
+    return True
+
+def write_audit_batch(batch: list[dict]):
+    """Inserts AuditLog rows in one transaction on its own session. Blocking; run in a thread."""
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(AuditLog, batch)
+        db.commit()
+    except Exception as e:
+        print(f"Audit Log Error: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+async def _drain(queue: asyncio.Queue):
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await queue.get()
+        stop = item is _STOP
+        batch = [] if stop else [item]
+        deadline = loop.time() + AUDIT_FLUSH_INTERVAL
+        while not stop and len(batch) < AUDIT_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                stop = True
+            else:
+                batch.append(item)
+        if batch:
+            await asyncio.to_thread(write_audit_batch, batch)
+        if stop:
+            return
+
+def start_audit_writer():
+    """Starts the batch writer on the running event loop (call from app startup)."""
+    global _queue, _writer_task
+    _queue = asyncio.Queue()
+    _writer_task = asyncio.create_task(_drain(_queue))
+
+async def stop_audit_writer():
+    """Flushes everything queued so far, then stops the writer (call from app shutdown)."""
+    global _queue, _writer_task
+    if _writer_task is None:
+        return
+    # Detach first so late callers fall back to inline writes instead of a dead queue
+    queue, task = _queue, _writer_task
+    _queue = _writer_task = None
+    queue.put_nowait(_STOP)
+    await task
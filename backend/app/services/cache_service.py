@@ -1,9 +1,37 @@
 # app/services/cache_service.py
+import re
 import redis
-import json
+import orjson
 import hashlib
+import threading
+from functools import lru_cache
+from cachetools import TTLCache
 from app.config import settings
 
+STREAM_CHUNK_TOKENS = 20  # Whitespace-split tokens per streamed frame for cached answers
+_TOKEN_SPLIT_RE = re.compile(r'(\s+)')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def normalize_question(question: str) -> str:
+    """Cache-key form of a question: lowercased, whitespace collapsed, trailing ?.! dropped."""
+    return _WHITESPACE_RE.sub(" ", question.strip().lower()).rstrip("?.! ")
+
+def split_for_stream(text: str) -> list[str]:
+    """Splits an answer into ~20-token pieces for streaming, keeping whitespace intact."""
+    parts = _TOKEN_SPLIT_RE.split(text)
+    return ["".join(parts[i:i + STREAM_CHUNK_TOKENS]) for i in range(0, len(parts), STREAM_CHUNK_TOKENS)]
+
+HISTORY_MAX_MESSAGES = 6  # 3 user + 3 bot, to save LLM context window
+HISTORY_TTL = 3600  # 1 hour, so inactive sessions get cleaned up automatically
+
+# In-process copy of recently read/written QA entries, checked before Redis.
+# Short TTL: another worker's clear_all() is only visible here after it expires.
+QA_LOCAL_CACHE_SIZE = 4096
+QA_LOCAL_CACHE_TTL = 60  # seconds
+
+PRODUCTS_LIST_KEY = "products:list:v1"
+PRODUCTS_LIST_TTL = 300  # Safety net; product mutations invalidate explicitly
+
 class CacheService:
     def __init__(self):
         try:
@@ -14,10 +42,21 @@ class CacheService:
                 socket_connect_timeout=1
             )
             self.redis.ping() # Check connection
+            # Binary-safe client (same server) for raw embedding vectors and
+            # JSON payloads (orjson parses bytes directly, no decode step)
+            self.redis_bytes = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                decode_responses=False,
+                socket_connect_timeout=1
+            )
             self.enabled = True
         except redis.ConnectionError:
             print("Warning: Redis not connected. Caching disabled.")
             self.enabled = False
+        # Keyed by the full Redis QA key; guarded because lookups run on worker threads
+        self._qa_local = TTLCache(maxsize=QA_LOCAL_CACHE_SIZE, ttl=QA_LOCAL_CACHE_TTL)
+        self._qa_local_lock = threading.Lock()
 
     # ==========================================
     # 1. QA CACHE (Layer 1 - Exact Match)
@@ -31,24 +70,68 @@ class CacheService:
         # Clean inputs
         pid = str(product_id).lower().strip() if product_id else "global"
         lang = language.lower().strip() if language else "en"
-        q_clean = question.strip().lower()
+        # "What is X?" and "what  is x" share an entry
+        q_clean = normalize_question(question)
         
-        # Hash the question to ensure safe key characters and fixed length
-        q_hash = hashlib.md5(q_clean.encode()).hexdigest()
+        # Hash the question to ensure safe key characters and fixed length.
+        # 64-bit BLAKE2b: faster than MD5 and half the key length; collisions are
+        # irrelevant at per-product/language FAQ volumes
+        q_hash = hashlib.blake2b(q_clean.encode(), digest_size=8).hexdigest()
         
         return f"faq:qa:{pid}:{lang}:{q_hash}"
 
+    def _local_qa(self, key: str):
+        with self._qa_local_lock:
+            return self._qa_local.get(key)
+
+    def _remember_qa(self, key: str, payload: dict):
+        with self._qa_local_lock:
+            self._qa_local[key] = payload
+
+    def has_local_qa(self, product_id: str, language: str, question: str) -> bool:
+        """True when the exact-match entry is in process memory (no Redis round trip)."""
+        return self._local_qa(self._generate_qa_key(product_id, language, question)) is not None
+
     def get_qa_cache(self, product_id: str, language: str, question: str):
-        """Retrieve Exact Match from Redis (Layer 1)"""
+        """Retrieve Exact Match (Layer 1): process memory first, then Redis"""
         if not self.enabled: return None
         
         key = self._generate_qa_key(product_id, language, question)
-        data = self.redis.get(key)
-        
+        payload = self._local_qa(key)
+        if payload is not None:
+            return payload
+
+        data = self.redis_bytes.get(key)
         if data:
-            return json.loads(data)
+            payload = orjson.loads(data)
+            self._remember_qa(key, payload)
+            return payload
         return None
 
+    def get_precheck(self, session_id: str, product_id: str, language: str, question: str):
+        """
+        Fetches session history and the exact-match QA entry in one pipelined
+        round trip. Returns (history, qa_hit); qa_hit is keyed on `question` as given.
+        """
+        if not self.enabled: return [], None
+
+        qa_key = self._generate_qa_key(product_id, language, question)
+        local = self._local_qa(qa_key)
+        if local is not None:
+            # QA entry is already in memory; only the history needs Redis
+            return self.get_history(session_id), local
+
+        pipe = self.redis_bytes.pipeline(transaction=False)
+        pipe.lrange(f"chat:history:{session_id}", 0, -1)
+        pipe.get(qa_key)
+        raw_history, data = pipe.execute()
+
+        history = [orjson.loads(item) for item in raw_history] if session_id else []
+        payload = orjson.loads(data) if data else None
+        if payload is not None:
+            self._remember_qa(qa_key, payload)
+        return history, payload
+
     def set_qa_cache(self, product_id: str, language: str, question: str, answer: str, sources: list):
         """Store Exact Match in Redis (Layer 1)"""
         if not self.enabled: return
@@ -58,34 +141,35 @@ class CacheService:
         payload = {
             "answer": answer,
             "sources": sources,
+            "chunks": split_for_stream(answer),  # Pre-split so stream hits don't re-tokenize
             "timestamp": str(settings.APP_NAME) # Tracking metadata
         }
         
         # TTL: 24 hours (86400 seconds) per Section 5.2
-        self.redis.setex(key, 86400, json.dumps(payload))
+        self.redis_bytes.setex(key, 86400, orjson.dumps(payload))
+        self._remember_qa(key, payload)
 
     # ==========================================
     # 2. CONVERSATIONAL MEMORY (Session History)
     # ==========================================
 
-    def add_to_history(self, session_id: str, role: str, content: str):
+    def add_turn(self, session_id: str, user_msg: str, assistant_msg: str):
         """
-        Stores message in a Redis List: chat:history:{session_id}
+        Appends a user/assistant exchange in one round trip: a single RPUSH of
+        both messages, then trim and refresh the expiry in the same pipeline.
         """
         if not self.enabled or not session_id: return
-        
+
         key = f"chat:history:{session_id}"
-        message = json.dumps({"role": role, "content": content})
-        
-        # Push to the end of the list
-        self.redis.rpush(key, message)
-        
-        # Limit history to last 6 messages (3 user + 3 bot) to save LLM context window
-        if self.redis.llen(key) > 6:
-            self.redis.lpop(key)
-            
-        # Set expiry to 1 hour so inactive sessions get cleaned up automatically
-        self.redis.expire(key, 3600)
+        pipe = self.redis_bytes.pipeline(transaction=False)
+        pipe.rpush(
+            key,
+            orjson.dumps({"role": "user", "content": user_msg}),
+            orjson.dumps({"role": "assistant", "content": assistant_msg}),
+        )
+        pipe.ltrim(key, -HISTORY_MAX_MESSAGES, -1)
+        pipe.expire(key, HISTORY_TTL)
+        pipe.execute()
 
     def get_history(self, session_id: str) -> list:
         """
@@ -95,15 +179,88 @@ class CacheService:
         
         key = f"chat:history:{session_id}"
         # Get all items in the list (0 to -1)
-        raw_history = self.redis.lrange(key, 0, -1)
+        raw_history = self.redis_bytes.lrange(key, 0, -1)
         
-        return [json.loads(item) for item in raw_history]
+        return [orjson.loads(item) for item in raw_history]
 
     # ==========================================
-    # 3. UTILITIES
+    # 3. EMBEDDING CACHE (Ingestion)
+    # ==========================================
+
+    def _embedding_key(self, content_hash: str) -> str:
+        # Model name (and a non-default backend, whose int8 vectors differ slightly)
+        # is part of the key so switching models never serves stale vectors
+        if settings.EMBEDDING_BACKEND != "torch":
+            return f"emb:{settings.EMBEDDING_MODEL}:{settings.EMBEDDING_BACKEND}:{content_hash}"
+        return f"emb:{settings.EMBEDDING_MODEL}:{content_hash}"
+
+    # A Redis error only costs the reuse: lookups count as misses, write-backs are dropped
+
+    def get_embeddings(self, content_hashes: list) -> list:
+        """Returns the float32 vector bytes for each hash, or None on a miss. One MGET."""
+        if not self.enabled or not content_hashes:
+            return [None] * len(content_hashes)
+        try:
+            return self.redis_bytes.mget([self._embedding_key(h) for h in content_hashes])
+        except redis.RedisError as e:
+            print(f"Redis embedding cache read failed: {e}")
+            return [None] * len(content_hashes)
+
+    def set_embeddings(self, vectors_by_hash: dict):
+        """Stores float32 vector bytes keyed by content hash, pipelined into one round trip."""
+        if not self.enabled or not vectors_by_hash: return
+        try:
+            pipe = self.redis_bytes.pipeline(transaction=False)
+            for content_hash, packed in vectors_by_hash.items():
+                pipe.setex(self._embedding_key(content_hash), settings.EMBEDDING_CACHE_TTL, packed)
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"Redis embedding cache write failed: {e}")
+
+    # ==========================================
+    # 4. PRODUCT LIST (public GET /api/products/)
+    # ==========================================
+
+    # A Redis hiccup must never fail the public list or a committed product write:
+    # reads fall back to the DB, write/invalidate errors are logged (the TTL bounds staleness)
+
+    def get_products_list(self) -> bytes | None:
+        """The serialized product list (JSON bytes), or None on a miss or Redis error."""
+        if not self.enabled: return None
+        try:
+            return self.redis_bytes.get(PRODUCTS_LIST_KEY)
+        except redis.RedisError as e:
+            print(f"Redis products list read failed: {e}")
+            return None
+
+    def set_products_list(self, payload: bytes):
+        if not self.enabled: return
+        try:
+            self.redis_bytes.setex(PRODUCTS_LIST_KEY, PRODUCTS_LIST_TTL, payload)
+        except redis.RedisError as e:
+            print(f"Redis products list write failed: {e}")
+
+    def invalidate_products_list(self):
+        """Call after any product insert/update/delete."""
+        if not self.enabled: return
+        try:
+            self.redis.delete(PRODUCTS_LIST_KEY)
+        except redis.RedisError as e:
+            print(f"Redis products list invalidation failed: {e}")
+
+    # ==========================================
+    # 5. UTILITIES
     # ==========================================
 
     def clear_all(self):
-        """Wipes everything in Redis"""
+        """Wipes everything in Redis (and this process's QA copies)"""
+        with self._qa_local_lock:
+            self._qa_local.clear()
         if self.enabled:
-            self.redis.flushdb()
\ No newline at end of file
+            self.redis.flushdb()
+
+
+@lru_cache(maxsize=1)
+def get_cache_service() -> CacheService:
+    """Process-wide CacheService sharing one Redis connection pool."""
+    return CacheService()
@@ -1,6 +1,41 @@
-from sentence_transformers import SentenceTransformer
+from functools import lru_cache
+import numpy as np
 from app.config import settings
 
+class _OnnxEncoder:
+    """
+    Stand-in for SentenceTransformer.encode backed by an int8-quantized ONNX
+    export of the same model, run on ONNX Runtime's CPU provider.
+    Mean pooling + optional L2 normalization, as the E5 models expect.
+    """
+
+    def __init__(self, model_dir: str, file_name: str):
+        # Optional dependency: only needed when EMBEDDING_BACKEND=onnx
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir, file_name=file_name, provider="CPUExecutionProvider"
+        )
+
+    def encode(self, sentences, batch_size: int = 32, normalize_embeddings: bool = False, **_):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        batches = []
+        for i in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(
+                texts[i:i + batch_size], padding=True, truncation=True, max_length=512, return_tensors="np"
+            )
+            hidden = self.model(**inputs).last_hidden_state
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            batches.append((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        embeddings = np.concatenate(batches).astype(np.float32, copy=False)
+        if normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
+
+
 class EmbeddingService:
     _instance = None
     _model = None
@@ -8,19 +43,89 @@ class EmbeddingService:
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(EmbeddingService, cls).__new__(cls)
-            print(f"Loading embedding model: {settings.EMBEDDING_MODEL}...")
-            cls._model = SentenceTransformer(settings.EMBEDDING_MODEL)
+            if settings.EMBEDDING_BACKEND == "onnx":
+                if not settings.EMBEDDING_ONNX_DIR:
+                    raise ValueError("EMBEDDING_BACKEND=onnx requires EMBEDDING_ONNX_DIR")
+                print(f"Loading int8 ONNX embedding model from {settings.EMBEDDING_ONNX_DIR}...")
+                cls._model = _OnnxEncoder(settings.EMBEDDING_ONNX_DIR, settings.EMBEDDING_ONNX_FILE)
+                print("Model loaded successfully.")
+                return cls._instance
+            # Imported here so the onnx backend doesn't load torch for embeddings
+            # (the cross-encoder reranker, when enabled, still does)
+            import torch
+            from sentence_transformers import SentenceTransformer
+
+            device = settings.EMBEDDING_DEVICE or ("cuda" if torch.cuda.is_available() else "cpu")
+            print(f"Loading embedding model: {settings.EMBEDDING_MODEL} on {device}...")
+            cls._model = SentenceTransformer(settings.EMBEDDING_MODEL, device=device)
+            if device.startswith("cuda"):
+                # FP16 on GPU: ~2x throughput, half the memory and host transfer
+                cls._model.half()
             print("Model loaded successfully.")
         return cls._instance
 
-    def generate_document_embedding(self, text: str):
-        """Prepends 'passage: ' for E5 models."""
-        return self._model.encode(f"passage: {text}", normalize_embeddings=True).tolist()
+    def warm_up(self):
+        """One throwaway query so lazy kernel/graph setup happens before the first real request."""
+        self._model.encode("query: warm up", normalize_embeddings=True)
+
+    def generate_document_embedding(self, text: str) -> np.ndarray:
+        """Prepends 'passage: ' for E5 models. Returns a float32 vector; Chroma accepts it as-is."""
+        embedding = self._model.encode(
+            f"passage: {text}", show_progress_bar=False, convert_to_numpy=True, normalize_embeddings=True
+        )
+        return embedding.astype(np.float32, copy=False)
 
-    def generate_query_embedding(self, query: str):
-        """Prepends 'query: ' for E5 models."""
-        return self._model.encode(f"query: {query}", normalize_embeddings=True).tolist()
+    def generate_query_embedding(self, query: str) -> np.ndarray:
+        """Prepends 'query: ' for E5 models. Returns a float32 vector; Chroma accepts it as-is."""
+        embedding = self._model.encode(
+            f"query: {query}", show_progress_bar=False, convert_to_numpy=True, normalize_embeddings=True
+        )
+        return embedding.astype(np.float32, copy=False)
 
-    def generate_batch_document_embeddings(self, texts: list[str]):
+    def generate_query_embeddings(self, queries: list[str]) -> np.ndarray:
+        """Embeds several queries in one forward pass. Returns a float32 (n, dim) array."""
+        embeddings = self._model.encode(
+            [f"query: {q}" for q in queries],
+            batch_size=len(queries),
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+        return embeddings.astype(np.float32, copy=False)
+
+    def generate_batch_document_embeddings(self, texts: list[str]) -> np.ndarray:
+        """Batch-encodes passages. Returns a float32 (n, dim) array; Chroma accepts it as-is."""
         processed_texts = [f"passage: {t}" for t in texts]
-        return self._model.encode(processed_texts, normalize_embeddings=True).tolist()
+        embeddings = self._model.encode(
+            processed_texts,
+            batch_size=settings.EMBEDDING_BATCH_SIZE,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+        return embeddings.astype(np.float32, copy=False)
+
+
+def quantize_int8(embeddings: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-vector int8 quantization of (n, dim) embeddings.
+    Returns (int8 codes, float32 scales); 4x smaller than float32 at rest.
+    """
+    embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    scales = np.abs(embeddings).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(embeddings / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """Inverse of quantize_int8; re-normalizes so cosine/L2 distances stay comparable."""
+    vectors = codes.astype(np.float32) * scales[:, None]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+@lru_cache(maxsize=1)
+def get_embedding_service() -> EmbeddingService:
+    """Process-wide EmbeddingService; the model loads on first call only."""
+    return EmbeddingService()
@@ -0,0 +1,49 @@
+# app/services/faq_cache.py
+import time
+import asyncio
+import threading
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.models.faq import FAQ
+
+# Manual FAQs are few and rarely edited, so Layer 0 reads them from memory.
+# Admin mutations invalidate this process's copy; the TTL bounds staleness
+# for other worker processes.
+FAQ_CACHE_TTL = 60  # seconds
+
+_faq_answers: dict[tuple[int, str], str] | None = None
+_loaded_at = 0.0
+_lock = threading.Lock()
+
+
+def _normalize(question: str) -> str:
+    return question.strip().lower()
+
+def load_faq_cache(db: Session) -> dict:
+    """(Re)builds the {(product_id, normalized question): answer} map in one query."""
+    global _faq_answers, _loaded_at
+    rows = db.execute(select(FAQ.product_id, FAQ.question, FAQ.answer)).all()
+    answers = {}
+    for product_id, question, answer in rows:
+        # First FAQ wins on duplicates, matching the old .first() lookup
+        answers.setdefault((product_id, _normalize(question)), answer)
+    with _lock:
+        _faq_answers = answers
+        _loaded_at = time.monotonic()
+    return answers
+
+async def get_manual_faq(db: Session, product_id: int, q_lower: str) -> str | None:
+    """
+    Returns the manual FAQ answer for this product, or None. q_lower must be stripped + lowercased.
+    A stale map is reloaded in a worker thread, off the event loop.
+    """
+    answers = _faq_answers
+    if answers is None or time.monotonic() - _loaded_at > FAQ_CACHE_TTL:
+        answers = await asyncio.to_thread(load_faq_cache, db)
+    return answers.get((product_id, q_lower))
+
+def invalidate_faq_cache():
+    """Call after any FAQ insert/update/delete; the next lookup reloads."""
+    global _faq_answers
+    with _lock:
+        _faq_answers = None
@@ -1,14 +1,52 @@
-import re
-from groq import Groq
+import asyncio
+from functools import lru_cache
+import httpx
+from groq import AsyncGroq
 from app.config import settings
 
+# --- THE FINAL, SUPER-STRICT PROMPT ---
+# Identical bytes on every call, so it is the cacheable prefix of every request
+# (Groq prompt caching); everything per-call (language included) goes in the user turn.
+_SYSTEM_PROMPT = (
+    "You are an an AI data analyst for an insurance company. Your task is to answer the user's <question> by extracting structured data from the provided <documents>. "
+    "Output your answer directly without any preamble or conversational filler. "
+    "Follow these rules strictly:\n"
+    "- Extract ONLY facts, numbers, and lists from the provided <documents>."
+    "- Prioritize information from tables if available."
+    "- If you cannot find the exact information in the documents, you MUST state: 'The provided documents do not contain specific details on this topic.'"
+    "- Never ask the user for clarification."
+    "- Do not mention the document source in your answer."
+    "- Do not define terms like 'Sum Insured' unless specifically asked for a definition found in the documents. Only state the specific values."
+)
+
+
+DOCUMENT_CACHE_SIZE = 2048  # Formatted <document> blocks kept per process
+
+
+@lru_cache(maxsize=DOCUMENT_CACHE_SIZE)
+def _format_document(product: str, chunk: str) -> str:
+    """One <document> block. Popular chunks recur across requests, so each is cleaned once."""
+    # Clean up whitespace to make tables more readable for the AI
+    # (str.split() collapses the same whitespace runs as \s+, in C, and strips the ends)
+    return f"<document source='{product}'>\n{' '.join(chunk.split())}\n</document>"
+
 
 class LLMService:
     def __init__(self):
         self.model = settings.GROQ_MODEL
-        self.client = Groq(api_key=settings.GROQ_API_KEY)
+        # Async client: a request waiting on Groq holds no worker thread, and one
+        # keep-alive pool serves every in-flight call
+        self.client = AsyncGroq(
+            api_key=settings.GROQ_API_KEY,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+                timeout=httpx.Timeout(60.0, connect=5.0),
+            ),
+        )
+        # Caps concurrent Groq calls per process so bursts queue here instead of hitting rate limits
+        self._slots = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
 
-    def contextualize_query(self, history: list, current_question: str) -> str:
+    async def contextualize_query(self, history: list, current_question: str) -> str:
         """
         Rewrites user question based on history for better search.
         """
@@ -26,19 +64,20 @@ class LLMService:
         )
 
         try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    }
-                ],
-                model=self.model,
-                temperature=0,
-                max_tokens=1024,
-                top_p=1,
-                stop=None,
-            )
+            async with self._slots:
+                chat_completion = await self.client.chat.completions.create(
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": prompt,
+                        }
+                    ],
+                    model=self.model,
+                    temperature=0,
+                    max_tokens=1024,
+                    top_p=1,
+                    stop=None,
+                )
             rewritten = chat_completion.choices[0].message.content.strip()
             # Safety check: if LLM returns empty or hallucinated long text, use original
             if not rewritten or len(rewritten) > len(current_question) * 4:
@@ -48,52 +87,38 @@ class LLMService:
             print(f"LLM contextualize_query Error: {e}")
             return current_question
 
-    def _build_prompt(self, question, context_chunks, metadatas, language, history):
-        # 1. Format and Clean PDF Context using XML tags for clarity
-        formatted_context = []
-        for i, chunk in enumerate(context_chunks):
-            product = metadatas[i].get("product_name", "Unknown Policy")
-            # Clean up whitespace to make tables more readable for the AI
-            clean_chunk = re.sub(r'\s+', ' ', chunk).strip()
-            formatted_context.append(f"<document source='{product}'>\n{clean_chunk}\n</document>")
-        context_text = "\n\n".join(formatted_context)
-        
-        # 2. Format Chat History (remains the same)
-        history_text = ""
-        if history:
-            recent_msgs = history[-4:]
-            conversation_str = "\n".join([f"{m['role'].upper()}: {m['content']}" for m in recent_msgs])
-            history_text = f"<history>\n{conversation_str}\n</history>\n"
-
-        # --- THE FINAL, SUPER-STRICT PROMPT ---
-        system_prompt = (
-            "You are an an AI data analyst for an insurance company. Your task is to answer the user's <question> by extracting structured data from the provided <documents>. "
-            "Output your answer directly without any preamble or conversational filler. "
-            "Follow these rules strictly:\n"
-            "- Extract ONLY facts, numbers, and lists from the provided <documents>."
-            "- Prioritize information from tables if available."
-            "- If you cannot find the exact information in the documents, you MUST state: 'The provided documents do not contain specific details on this topic.'"
-            "- Never ask the user for clarification."
-            "- Do not mention the document source in your answer."
-            "- Do not define terms like 'Sum Insured' unless specifically asked for a definition found in the documents. Only state the specific values."
-            f"Provide the answer in {language}."
+    def _build_messages(self, question, context_chunks, metadatas, language, history) -> list[dict]:
+        """
+        [system, *recent turns, user]: the fixed system prompt and the session's earlier
+        turns form a prefix that repeats across follow-ups (prompt-cache friendly); only
+        the last message, freshly retrieved documents + the question, changes per call.
+        """
+        # 1. Format and Clean PDF Context using XML tags for clarity.
+        # Duplicates are dropped and the rest put in a fixed (product, text) order, so the
+        # same retrieved set always produces the same bytes (and the same cached prefix)
+        documents = {}
+        for chunk, meta in zip(context_chunks, metadatas):
+            documents.setdefault(chunk, meta.get("product_name") or "Unknown Policy")
+        context_text = "\n\n".join(
+            _format_document(product, chunk)
+            for chunk, product in sorted(documents.items(), key=lambda item: (item[1], item[0]))
         )
         
-        user_prompt = f"""
-        Here are the documents to use:
-        <documents>
-        {context_text}
-        </documents>
-
-        {history_text}
-
-        <question>
-        {question}
-        </question>
-        """
-        return system_prompt, user_prompt
+        # 2. Chat History as real chat turns, oldest first
+        messages = [{"role": "system", "content": _SYSTEM_PROMPT}]
+        for m in history[-4:]:
+            messages.append({"role": "user" if m["role"] == "user" else "assistant", "content": m["content"]})
+
+        # No template indentation: every leading space would be sent (and billed) as prompt tokens
+        messages.append({"role": "user", "content": (
+            "Here are the documents to use:\n"
+            f"<documents>\n{context_text}\n</documents>\n\n"
+            f"<question>\n{question}\n</question>\n\n"
+            f"Provide the answer in {language}."
+        )})
+        return messages
 
-    def generate_answer(
+    async def generate_answer(
         self, 
         question: str, 
         context_chunks: list[str], 
@@ -102,26 +127,24 @@ class LLMService:
         history: list = []
     ) -> str:
         """Generates a complete, non-streaming answer."""
-        system_prompt, user_prompt = self._build_prompt(question, context_chunks, metadatas, language, history)
+        messages = self._build_messages(question, context_chunks, metadatas, language, history)
 
         try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                model=self.model,
-                temperature=0.5,
-                max_tokens=300,
-                top_p=1,
-                stop=None,
-            )
+            async with self._slots:
+                chat_completion = await self.client.chat.completions.create(
+                    messages=messages,
+                    model=self.model,
+                    temperature=0.5,
+                    max_tokens=300,
+                    top_p=1,
+                    stop=None,
+                )
             return chat_completion.choices[0].message.content
         except Exception as e:
             print(f"LLM Error: {e}")
             return "I apologize, but I encountered an error generating the response."
 
-    def stream_answer(
+    async def stream_answer(
         self, 
         question: str, 
         context_chunks: list[str], 
@@ -130,46 +153,51 @@ class LLMService:
         history: list = []
     ):
         """Generates a streaming answer while suppressing <think> blocks in real-time."""
-        system_prompt, user_prompt = self._build_prompt(question, context_chunks, metadatas, language, history)
+        messages = self._build_messages(question, context_chunks, metadatas, language, history)
 
         try:
-            stream = self.client.chat.completions.create(
-                model=self.model, 
-                messages=[
-                    {'role': 'system', 'content': system_prompt},
-                    {'role': 'user', 'content': user_prompt},
-                ],
-                temperature=0.5,
-                max_tokens=300,
-                top_p=1,
-                stop=None,
-                stream=True,
-            )
-            
-            buffer = ""
-            is_answering = False
-
-            for chunk in stream:
-                content = chunk.choices[0].delta.content
-                if not content:
-                    continue
+            # The slot is held for the whole stream: that is how long the call occupies Groq
+            async with self._slots:
+                stream = await self.client.chat.completions.create(
+                    model=self.model, 
+                    messages=messages,
+                    temperature=0.5,
+                    max_tokens=300,
+                    top_p=1,
+                    stop=None,
+                    stream=True,
+                )
+                
+                buffer = ""
+                is_answering = False
+
+                async for chunk in stream:
+                    content = chunk.choices[0].delta.content
+                    if not content:
+                        continue
+                    
+                    buffer += content
+
+                    if not is_answering:
+                        if "</think>" in buffer:
+                            parts = buffer.split("</think>", 1)
+                            answer_start = parts[1]
+                            is_answering = True
+                            if answer_start:
+                                yield answer_start
+                            buffer = ""
+                    else:
+                        yield content
                 
-                buffer += content
-
-                if not is_answering:
-                    if "</think>" in buffer:
-                        parts = buffer.split("</think>", 1)
-                        answer_start = parts[1]
-                        is_answering = True
-                        if answer_start:
-                            yield answer_start
-                        buffer = ""
-                else:
-                    yield content
-            
-            if not is_answering and buffer:
-                yield buffer
+                if not is_answering and buffer:
+                    yield buffer
 
         except Exception as e:
             print(f"LLM Stream Error: {e}")
             yield "I apologize, but I encountered an error generating the response."
+
+
+@lru_cache(maxsize=1)
+def get_llm_service() -> LLMService:
+    """Process-wide LLMService sharing one async Groq HTTP client."""
+    return LLMService()
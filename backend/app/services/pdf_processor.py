@@ -1,22 +1,63 @@
 # app/services/pdf_processor.py
-import pdfplumber
+import fitz  # PyMuPDF
 import re
-from typing import List, Dict
+from functools import lru_cache
+from typing import List, Dict, Tuple
+
+# OCR is optional: only needed for scanned (image-only) PDFs
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:
+    pytesseract = None
+
+# Legal boilerplate and broken-font (cid) text; tagged at ingest so search can skip it
+_BOILERPLATE_RE = re.compile(r'disclaimer|regd\. office|\(cid:', re.IGNORECASE)
+# A chunk is only tagged when it is mostly boilerplate (one marker per this many words);
+# a stray footer or a few cid artifacts leave it searchable, the chat re-ranker penalizes those
+BOILERPLATE_WORDS_PER_MARKER = 50
+# Short page lines naming the disclaimer / registered office are footers, dropped at extraction
+_FOOTER_LINE_RE = re.compile(r'disclaimer|regd\. office', re.IGNORECASE)
+FOOTER_LINE_MAX_WORDS = 30
 
 class PDFProcessor:
-    def __init__(self, chunk_size: int = 600, overlap: int = 100):
+    def __init__(self, chunk_size: int = 600, overlap: int = 100, ocr_min_chars: int = 50):
         self.chunk_size = chunk_size
         self.overlap = overlap
+        # Pages with less extractable text than this are treated as scanned images
+        self.ocr_min_chars = ocr_min_chars
 
     def extract_text(self, file_path: str) -> str:
         """Extracts text from a PDF file."""
-        text = ""
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
+        pages = []
+        with fitz.open(file_path) as doc:
+            for page in doc:
+                page_text = page.get_text("text")
+                if len(page_text.strip()) < self.ocr_min_chars:
+                    page_text = self._ocr_page(page) or page_text
+                page_text = self._strip_footer_lines(page_text)
                 if page_text:
-                    text += page_text + "\n"
-        return self.clean_text(text)
+                    pages.append(page_text)
+        return self.clean_text("\n".join(pages))
+
+    def _strip_footer_lines(self, page_text: str) -> str:
+        """Drops short disclaimer / registered-office lines (page footers), keeping the page body."""
+        return "\n".join(
+            line for line in page_text.splitlines()
+            if not (_FOOTER_LINE_RE.search(line) and len(line.split()) <= FOOTER_LINE_MAX_WORDS)
+        )
+
+    def _ocr_page(self, page) -> str:
+        """Runs Tesseract on a rendered page. Only used for low-text (scanned) pages."""
+        if pytesseract is None:
+            return ""
+        try:
+            pix = page.get_pixmap(dpi=300)
+            image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+            return pytesseract.image_to_string(image)
+        except Exception as e:
+            print(f"OCR failed on page {page.number}: {e}")
+            return ""
 
     def clean_text(self, text: str) -> str:
         """Basic text cleaning."""
@@ -26,11 +67,13 @@ class PDFProcessor:
         text = re.sub(r'\s+', ' ', text)
         return text.strip()
 
-    def create_chunks(self, text: str, meta: Dict) -> List[Dict]:
-        """Splits text into overlapping chunks with metadata."""
+    def create_chunks(self, text: str, meta: Dict) -> Tuple[List[str], List[Dict]]:
+        """
+        Splits text into overlapping chunks with metadata.
+        Returns parallel (texts, metadatas) lists, the shape the vector DB takes.
+        """
         words = text.split()
-        chunks = []
-        filename = meta.get("source", "Unknown")
+        texts, metadatas = [], []
 
         for i in range(0, len(words), self.chunk_size - self.overlap):
             chunk_words = words[i : i + self.chunk_size]
@@ -40,19 +83,26 @@ class PDFProcessor:
             if len(chunk_words) < 50:
                 continue
             
-            enhanced_chunk = f"Source Document: {filename}\nSection: Policy Details\nContent: {chunk_text}"
-
-            chunks.append({
-                "text": enhanced_chunk,
-                "metadata": {
-                    **meta,
-                    "chunk_index": len(chunks),
-                    "word_count": len(chunk_words)
-                }
+            # The source filename stays in metadata only: uploads are stored under uuid
+            # names, and keeping them out of the text lets identical content share a vector
+            enhanced_chunk = f"Section: Policy Details\nContent: {chunk_text}"
+
+            metadatas.append({
+                **meta,
+                "chunk_index": len(texts),
+                "word_count": len(chunk_words),
+                "boilerplate": len(_BOILERPLATE_RE.findall(chunk_text)) * BOILERPLATE_WORDS_PER_MARKER >= len(chunk_words)
             })
+            texts.append(enhanced_chunk)
             
             # Stop if we've reached the end
             if i + self.chunk_size >= len(words):
                 break
                 
-        return chunks
\ No newline at end of file
+        return texts, metadatas
+
+
+@lru_cache(maxsize=1)
+def get_pdf_processor() -> PDFProcessor:
+    """Process-wide PDFProcessor (default chunking settings)."""
+    return PDFProcessor()
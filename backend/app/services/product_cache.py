@@ -0,0 +1,60 @@
+# app/services/product_cache.py
+import re
+import time
+import asyncio
+import threading
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.models.product import Product
+
+# Chat requests consult the product list several times (name detection,
+# summary intent, comparison intent); it changes only through admin routes.
+# Same scheme as the FAQ cache: local invalidation + a TTL for other workers.
+PRODUCT_CACHE_TTL = 60  # seconds
+
+_products: list[tuple[int, str, str]] | None = None
+# One alternation of all lowercased names (longest first, so a name that
+# contains another wins) -> a single pass over the text finds every mention
+_name_matcher: tuple[re.Pattern | None, dict[str, str]] = (None, {})
+_loaded_at = 0.0
+_lock = threading.Lock()
+
+
+def load_product_cache(db: Session) -> list[tuple[int, str, str]]:
+    """(Re)loads [(id, name, lowercased name), ...] in one query."""
+    global _products, _name_matcher, _loaded_at
+    rows = db.execute(select(Product.id, Product.name).order_by(Product.id)).all()
+    products = [(pid, name, name.lower()) for pid, name in rows]
+    by_lower = {}
+    for _, name, name_lower in products:
+        by_lower.setdefault(name_lower, name)
+    pattern = None
+    if by_lower:
+        alternation = "|".join(re.escape(n) for n in sorted(by_lower, key=len, reverse=True))
+        pattern = re.compile(alternation)
+    with _lock:
+        _products = products
+        _name_matcher = (pattern, by_lower)
+        _loaded_at = time.monotonic()
+    return products
+
+async def get_products(db: Session) -> list[tuple[int, str, str]]:
+    """Cached [(id, name, lowercased name), ...]; reloads in a worker thread when stale or invalidated."""
+    products = _products
+    if products is None or time.monotonic() - _loaded_at > PRODUCT_CACHE_TTL:
+        products = await asyncio.to_thread(load_product_cache, db)
+    return products
+
+async def find_product_names(db: Session, text_lower: str) -> list[str]:
+    """Product names mentioned in the (lowercased) text, in order of first mention, deduplicated."""
+    await get_products(db)  # Refreshes the matcher along with the list when stale
+    pattern, by_lower = _name_matcher
+    if pattern is None:
+        return []
+    return list(dict.fromkeys(by_lower[m] for m in pattern.findall(text_lower)))
+
+def invalidate_product_cache():
+    """Call after any product insert/update/delete; the next lookup reloads."""
+    global _products
+    with _lock:
+        _products = None
@@ -1,5 +1,6 @@
-from sentence_transformers import CrossEncoder
-import torch
+from functools import lru_cache
+import numpy as np
+from app.config import settings
 
 class RerankerService:
     _instance = None
@@ -8,25 +9,34 @@ class RerankerService:
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(RerankerService, cls).__new__(cls)
+            # Imported here so importing the chat routes doesn't load torch when the reranker is off
+            from sentence_transformers import CrossEncoder
+
             # This model is tiny (20MB) and very fast on CPU
-            cls._model = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2', device='cpu')
+            cls._model = CrossEncoder(settings.RERANKER_MODEL, device='cpu')
         return cls._instance
 
+    def warm_up(self):
+        """One throwaway pair so the first chat request doesn't pay for lazy setup."""
+        self._model.predict([["warm up", "warm up"]], show_progress_bar=False)
+
     def rank_documents(self, query: str, documents: list[str], top_k: int = 3):
+        return [documents[i] for i in self.rank_indices(query, documents, top_k)]
+
+    def rank_indices(self, query: str, documents: list[str], top_k: int = 3) -> list[int]:
+        """Positions of the top_k documents by cross-encoder score; ties keep input order."""
         if not documents: return []
         
         # Prepare pairs: [[query, doc1], [query, doc2]...]
         pairs = [[query, doc] for doc in documents]
         
         # Score them
-        scores = self._model.predict(pairs)
+        scores = np.asarray(self._model.predict(pairs, show_progress_bar=False))
         
-        # Combine docs with scores and sort
-        scored_docs = sorted(
-            zip(documents, scores), 
-            key=lambda x: x[1], 
-            reverse=True
-        )
-        
-        # Return top K documents
-        return [doc for doc, score in scored_docs[:top_k]]
\ No newline at end of file
+        return np.argsort(-scores, kind="stable")[:top_k].tolist()
+
+
+@lru_cache(maxsize=1)
+def get_reranker_service() -> RerankerService | None:
+    """Process-wide cross-encoder, or None when RERANKER_ENABLED is off."""
+    return RerankerService() if settings.RERANKER_ENABLED else None
@@ -4,9 +4,10 @@ import json
 from sqlalchemy.orm import Session
 from app.config import settings
 from app.models import Product, PDFDocument
-from app.services.pdf_processor import PDFProcessor
-from app.services.embedding_service import EmbeddingService
-from app.services.vector_db import VectorDBService
+from app.services.pdf_processor import get_pdf_processor
+from app.services.embedding_service import get_embedding_service
+from app.services.vector_db import get_vector_service
+from app.services.cache_service import get_cache_service
 
 def run_startup_processing(db: Session):
     preload_dir = settings.PDF_PRELOAD_DIR
@@ -31,6 +32,7 @@ def run_startup_processing(db: Session):
             db.add(product)
             db.commit()
             db.refresh(product)
+            get_cache_service().invalidate_products_list()  # Public list is cached in Redis
 
         # 2. Process PDFs
         for pdf_entry in data["pdfs"]:
@@ -52,36 +54,41 @@ def run_startup_processing(db: Session):
                 continue
 
             print(f"Processing {relative_path}...")
+            source = os.path.basename(full_path)
+
+            # DB record first: its id keys the vectors ("{pdf_id}:{i}", as for uploads), so
+            # several PDFs of one product never overwrite each other's chunks
+            pdf = existing_pdf
+            if not pdf:
+                pdf = PDFDocument(
+                    product_id=product.id,
+                    file_name=source,
+                    file_path=full_path,
+                    file_size=os.path.getsize(full_path),
+                    status="processing"
+                )
+                db.add(pdf)
+                db.commit()
+                db.refresh(pdf)
             
             # --- Processing Logic (Copy of Admin Logic) ---
-            processor = PDFProcessor()
+            processor = get_pdf_processor()
             text = processor.extract_text(full_path)
-            chunks = processor.create_chunks(text, {"source": os.path.basename(full_path)})
+            texts, metadatas = processor.create_chunks(text, {"source": source})
             
-            embed_service = EmbeddingService()
-            texts = [c["text"] for c in chunks]
+            # Same process-wide instances the chat routes use (model + Chroma client load once)
+            embed_service = get_embedding_service()
             embeddings = embed_service.generate_batch_document_embeddings(texts)
             
-            vector_service = VectorDBService()
-            ids = [f"{product_name}_{product.id}_{i}_pre" for i in range(len(chunks))]
-            metadatas = [c["metadata"] for c in chunks]
+            vector_service = get_vector_service()
+            # A re-run (earlier attempt failed midway) drops this PDF's previous chunks first
+            vector_service.delete_document_chunks(product_name, source)
+            ids = [f"{pdf.id}:{i}" for i in range(len(texts))]
             
             vector_service.add_documents(product_name, texts, metadatas, ids, embeddings)
             # ----------------------------------------------
 
-            # Create/Update DB Record
-            if not existing_pdf:
-                new_pdf = PDFDocument(
-                    product_id=product.id,
-                    file_name=os.path.basename(full_path),
-                    file_path=full_path,
-                    file_size=os.path.getsize(full_path),
-                    status="completed",
-                    chunk_count=len(chunks)
-                )
-                db.add(new_pdf)
-            else:
-                existing_pdf.status = "completed"
-            
+            pdf.status = "completed"
+            pdf.chunk_count = len(texts)
             db.commit()
             print(f"Done: {relative_path}")
\ No newline at end of file
@@ -1,13 +1,43 @@
 # app/services/vector_db.py
+import os
+import sqlite3
 import chromadb
 import json
 import hashlib
+import time
+from functools import lru_cache
 from app.config import settings
 
+SUGGESTIONS_TTL = 60  # seconds; /suggestions is polled by the UI
+
 class VectorDBService:
+    _sqlite_tuned = False
+
     def __init__(self):
         # Initialize persistent client
         self.client = chromadb.PersistentClient(path=settings.VECTOR_DB_PATH)
+        self._suggestions = {}  # limit -> (fetched_at, questions)
+        if not VectorDBService._sqlite_tuned:
+            self._tune_sqlite()
+            VectorDBService._sqlite_tuned = True
+
+    def _tune_sqlite(self):
+        """
+        Switches Chroma's SQLite store to WAL so batched upserts don't pay a
+        full rollback-journal fsync per transaction. journal_mode is persisted
+        in the DB file, so setting it once from our own connection sticks.
+        """
+        db_file = os.path.join(settings.VECTOR_DB_PATH, "chroma.sqlite3")
+        if not os.path.exists(db_file):
+            return
+        try:
+            conn = sqlite3.connect(db_file)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Warning: Could not tune Chroma SQLite store: {e}")
 
     # ==========================================
     # 1. GLOBAL DOCUMENT SEARCH (RAG)
@@ -35,22 +65,40 @@ class VectorDBService:
                 new_meta["source"] = "Unknown File"
             enhanced_metadatas.append(new_meta)
 
-        collection.upsert(
-            documents=documents,
-            metadatas=enhanced_metadatas,
-            ids=ids,
-            embeddings=embeddings
-        )
+        # Write in fixed-size batches: one huge upsert is a single giant
+        # transaction, and Chroma ingests fastest at ~100-250 rows per call
+        batch_size = settings.CHROMA_BATCH_SIZE
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            collection.upsert(
+                documents=documents[start:end],
+                metadatas=enhanced_metadatas[start:end],
+                ids=ids[start:end],
+                embeddings=embeddings[start:end]
+            )
+
+    def delete_document_chunks(self, product_name: str, source: str):
+        """
+        Removes every chunk of one PDF (matched by source file + product), whatever
+        ID scheme it was stored under. Run before re-adding a reprocessed PDF.
+        """
+        collection = self.get_global_collection()
+        collection.delete(where={"$and": [
+            {"source": source},
+            {"product_name": product_name.strip().title()},
+        ]})
 
     def search(self, query_embedding: list, n_results: int = 15, product_filter: str = None):
         """
-        Searches the global collection. 
+        Searches the global collection, skipping chunks tagged at ingest as mostly boilerplate.
         If product_filter is provided (e.g. "Care Supreme"), it restricts search to that product.
         """
         collection = self.get_global_collection()
         
-        # Prepare filter dict if provided
-        where_clause = {"product_name": product_filter} if product_filter else None
+        # Prepare filter dict; the boilerplate filter runs inside Chroma, not on our side
+        where_clause = {"boilerplate": {"$ne": True}}
+        if product_filter:
+            where_clause = {"$and": [{"product_name": product_filter}, where_clause]}
         
         return collection.query(
             query_embeddings=[query_embedding],
@@ -133,16 +181,21 @@ class VectorDBService:
     def get_all_cached_questions(self, limit: int = 10):
         """
         Retrieves a list of frequently asked questions from the semantic cache.
+        Served from memory for SUGGESTIONS_TTL seconds between Chroma reads.
         """
+        cached = self._suggestions.get(limit)
+        if cached and time.monotonic() - cached[0] < SUGGESTIONS_TTL:
+            return cached[1]
+
         collection = self.get_cache_collection()
         
         # Get the first 'limit' number of entries from the cache
         results = collection.get(limit=limit)
         
-        if not results or not results['documents']:
-            return []
-            
-        return results['documents'] # The 'documents' field holds the actual question text
+        # The 'documents' field holds the actual question text
+        questions = results['documents'] if results and results['documents'] else []
+        self._suggestions[limit] = (time.monotonic(), questions)
+        return questions
 
 
 
@@ -155,6 +208,7 @@ class VectorDBService:
                 
             # Recreate it immediately
             self.get_cache_collection()
+            self._suggestions.clear()
     def clear_knowledge_base(self):
         """Deletes the main document collection (RAG Data)."""
         try:
@@ -163,4 +217,10 @@ class VectorDBService:
             pass # Collection didn't exist
         
         # Recreate immediately
-        self.get_global_collection()
\ No newline at end of file
+        self.get_global_collection()
+
+
+@lru_cache(maxsize=1)
+def get_vector_service() -> VectorDBService:
+    """Process-wide VectorDBService sharing one persistent Chroma client."""
+    return VectorDBService()
@@ -0,0 +1,18 @@
+# app/tasks/__init__.py
+# Out-of-process worker pool for CPU-heavy jobs (PDF extraction + embedding).
+# Run workers from the backend directory with:
+#   celery -A app.tasks worker --concurrency=N
+from celery import Celery
+from app.config import settings
+
+celery_app = Celery(
+    "insurance_faq",
+    broker=settings.CELERY_BROKER_URL,
+    include=["app.tasks.pdf_tasks"],
+)
+
+celery_app.conf.update(
+    task_ignore_result=True,        # Status is tracked on the PDFDocument row
+    task_acks_late=True,            # Re-queue the PDF if a worker dies mid-job
+    worker_prefetch_multiplier=1,   # Long jobs: don't let one worker hoard the queue
+)
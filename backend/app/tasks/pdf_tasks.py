@@ -0,0 +1,114 @@
+# app/tasks/pdf_tasks.py
+import os
+import hashlib
+import logging
+import numpy as np
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.database.connection import SessionLocal
+from app.models import PDFDocument
+from app.services.pdf_processor import get_pdf_processor
+from app.services.embedding_service import get_embedding_service
+from app.services.cache_service import CacheService, get_cache_service
+from app.services.vector_db import get_vector_service
+from app.tasks import celery_app
+
+logger = logging.getLogger(__name__)
+
+
+def _embed_with_cache(texts: list[str], embed_service, cache: CacheService) -> np.ndarray:
+    """
+    Embeds chunks, reusing vectors for chunk texts seen before (re-uploads,
+    boilerplate shared across policy documents). Only unseen texts hit the model.
+    Vectors are cached as raw float32, so a reused vector is exactly the one
+    the model produced on first ingest.
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    hashes = [hashlib.blake2b(t.encode(), digest_size=16).hexdigest() for t in texts]
+    cached = cache.get_embeddings(hashes)
+
+    vectors = {h: np.frombuffer(packed, dtype=np.float32) for h, packed in zip(hashes, cached) if packed is not None}
+    # First occurrence of each uncached hash, so duplicates within this PDF embed once
+    missing = {}
+    for i, h in enumerate(hashes):
+        if h not in vectors:
+            missing.setdefault(h, i)
+
+    if missing:
+        fresh = np.asarray(
+            embed_service.generate_batch_document_embeddings([texts[i] for i in missing.values()]),
+            dtype=np.float32,
+        )
+        vectors.update(zip(missing.keys(), fresh))
+        cache.set_embeddings({h: v.tobytes() for h, v in zip(missing.keys(), fresh)})
+    logger.info(
+        "embedding_cache",
+        extra={"chunks": len(texts), "reused": len(texts) - len(missing), "embedded": len(missing)},
+    )
+
+    return np.stack([vectors[h] for h in hashes])
+
+
+def process_pdf_background(file_path: str, product_name: str, pdf_db_id: int, db: Session):
+    """
+    Extracts text, generates embeddings, and stores vectors in ChromaDB.
+    """
+    try:
+        # 1. Extract Text
+        processor = get_pdf_processor()
+        text = processor.extract_text(file_path)
+        source = os.path.basename(file_path)
+        texts, metadatas = processor.create_chunks(text, {"source": source})
+        
+        # 2. Generate Embeddings (cache misses only)
+        embed_service = get_embedding_service()
+        embeddings = _embed_with_cache(texts, embed_service, get_cache_service())
+        
+        # 3. Store in Vector DB (Global Collection)
+        vector_service = get_vector_service()
+        # Reprocessing: drop this PDF's previous chunks first, so ones stored under an
+        # older ID scheme (or beyond the new chunk count) don't linger as duplicates
+        vector_service.delete_document_chunks(product_name, source)
+        
+        # Create unique IDs for ChromaDB (PDF row id is already globally unique)
+        ids = [f"{pdf_db_id}:{i}" for i in range(len(texts))]
+        
+        # Pass product_name so it gets stamped on every chunk's metadata
+        vector_service.add_documents(
+            product_name=product_name, 
+            documents=texts,
+            metadatas=metadatas,
+            ids=ids,
+            embeddings=embeddings
+        )
+        
+        # 4. Update Database Status to 'completed' (single UPDATE, no row load)
+        db.execute(
+            update(PDFDocument)
+            .where(PDFDocument.id == pdf_db_id)
+            .values(status="completed", chunk_count=len(texts))
+        )
+        db.commit()
+            
+    except Exception:
+        logger.exception("pdf_process_failed", extra={"pdf_id": pdf_db_id, "product": product_name})
+        # Mark as error in DB (single UPDATE, no row load)
+        db.rollback()
+        db.execute(
+            update(PDFDocument)
+            .where(PDFDocument.id == pdf_db_id)
+            .values(status="error")
+        )
+        db.commit()
+
+
+@celery_app.task(name="pdf.process")
+def process_pdf_task(file_path: str, product_name: str, pdf_db_id: int):
+    """Worker entry point. Opens its own session; request sessions never cross processes."""
+    db = SessionLocal()
+    try:
+        process_pdf_background(file_path, product_name, pdf_db_id, db)
+    finally:
+        db.close()
@@ -0,0 +1,29 @@
+# app/utils/compression.py
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# Brotli is optional: gzip covers every browser, br just shrinks JSON further
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+# The chat stream must reach the browser token by token; a compressor would
+# hold frames back until its window fills.
+_UNCOMPRESSED_PATH_SUFFIXES = ("/ask_stream",)
+
+class CompressionMiddleware:
+    """Brotli (gzip fallback) for regular responses; streaming routes pass through untouched."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500) -> None:
+        self.app = app
+        if BrotliMiddleware is not None:
+            self.compressed = BrotliMiddleware(app, quality=4, minimum_size=minimum_size, gzip_fallback=True)
+        else:
+            self.compressed = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and not scope["path"].endswith(_UNCOMPRESSED_PATH_SUFFIXES):
+            await self.compressed(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
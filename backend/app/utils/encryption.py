@@ -1,4 +1,6 @@
 # app/utils/encryption.py
+from functools import lru_cache
+from typing import Iterable
 from cryptography.fernet import Fernet
 from fastapi import HTTPException, status
 from ..config import settings
@@ -19,6 +21,14 @@ def encrypt_id(id_to_encrypt: int) -> str:
     
     return fernet.encrypt(str(id_to_encrypt).encode()).decode()
 
+def encrypt_ids(ids: Iterable[int]) -> list[str]:
+    """Encrypts many integer IDs in one pass, reusing the module-level cipher."""
+    encrypt = fernet.encrypt
+    return [encrypt(str(i).encode()).decode() for i in ids]
+
+# Tokens are immutable, so repeat decryptions (e.g. status polling) are memoized.
+# Failures raise and are therefore never cached.
+@lru_cache(maxsize=4096)
 def decrypt_id(encrypted_id: str) -> int:
     """Decrypts an encrypted ID string back to an integer."""
     try:
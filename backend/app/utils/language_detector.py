@@ -1,6 +1,12 @@
 # app/utils/language_detector.py
+from collections import OrderedDict
+from functools import lru_cache
 from langdetect import detect, LangDetectException
 
+SESSION_LANG_MAX = 4096  # Sessions whose language we remember (LRU)
+_session_langs: OrderedDict[str, str] = OrderedDict()
+
+@lru_cache(maxsize=1024)
 def detect_language(text: str) -> str:
     text_lower = text.lower()
     
@@ -19,4 +25,24 @@ def detect_language(text: str) -> str:
             return lang
         return "en" # Fallback to English for 'et', 'sv', etc.
     except LangDetectException:
-        return "en"
\ No newline at end of file
+        return "en"
+
+def detect_session_language(session_id: str | None, text: str) -> str:
+    """
+    Detects once per session and reuses the result: users rarely switch
+    language mid-chat. Only questions of 4+ words are trusted to set it,
+    since detection on a word or two is unreliable.
+    """
+    if session_id:
+        lang = _session_langs.get(session_id)
+        if lang:
+            _session_langs.move_to_end(session_id)
+            return lang
+
+    lang = detect_language(text)
+    if session_id and len(text.split()) > 3:
+        _session_langs[session_id] = lang
+        _session_langs.move_to_end(session_id)
+        if len(_session_langs) > SESSION_LANG_MAX:
+            _session_langs.popitem(last=False)
+    return lang
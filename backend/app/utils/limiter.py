@@ -1,6 +1,13 @@
 # app/utils/limiter.py
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+from app.config import settings
 
-# Initialize the limiter using the client's IP address as the key
-limiter = Limiter(key_func=get_remote_address)
\ No newline at end of file
+# Initialize the limiter using the client's IP address as the key.
+# Counters live in Redis so every worker enforces the same limit; if Redis is
+# unreachable each process falls back to its own in-memory counters.
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=settings.RATE_LIMIT_STORAGE_URL,
+    in_memory_fallback_enabled=True,
+)
@@ -1,10 +1,16 @@
 # app/utils/security.py
+import time
+import hashlib
+import threading
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 import bcrypt
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from app.config import settings
 from app.database.connection import get_db
@@ -17,6 +23,22 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# Token -> subject cache so repeated requests skip the JWT decode. Only the decode is
+# cached: id and role are read on every request, so a role change applies at once on all workers
+TOKEN_CACHE_TTL = 60  # seconds; never outlives the token's own exp
+TOKEN_CACHE_MAX = 2048
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    """Lightweight stand-in for the User row: just what auth checks need."""
+    id: int
+    email: str
+    role: str
+
+# token hash -> (token exp, email); the TTLCache bounds size and age, exp is checked on read
+_token_cache: TTLCache = TTLCache(maxsize=TOKEN_CACHE_MAX, ttl=TOKEN_CACHE_TTL)
+_token_cache_lock = threading.Lock()
+
 def verify_password(plain_password, hashed_password):
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
@@ -40,21 +62,29 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+    token_key = hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+    with _token_cache_lock:
+        cached = _token_cache.get(token_key)
+    if cached and cached[0] > time.time():
+        email = cached[1]
+    else:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            email: str = payload.get("sub")
+            if email is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-        
-    user = db.query(User).filter(User.email == email).first()
+        with _token_cache_lock:
+            _token_cache[token_key] = (payload.get("exp", 0), email)
+
+    user = db.execute(select(User.id, User.email, User.role).where(User.email == email)).first()
     if user is None:
         raise credentials_exception
-    return user
+    return UserPrincipal(id=user.id, email=user.email, role=user.role)
 
 # Dependency to check if user is Admin
-async def get_current_admin(current_user: User = Depends(get_current_user)):
+async def get_current_admin(current_user: UserPrincipal = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(
             status_code=403, 
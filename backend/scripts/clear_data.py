@@ -12,6 +12,8 @@ sys.path.append(backend_path)
 from app.database.connection import SessionLocal
 from app.models.product import Product
 from app.models.product import PDFDocument
+from app.models.faq import FAQ
+from app.models.user_product_access import UserProductAccess
 
 # --- File Paths ---
 UPLOADS_DIR = os.path.join(backend_path, "../data/pdfs/uploads")
@@ -26,6 +28,11 @@ def clear_database_tables():
         num_pdfs_deleted = db.query(PDFDocument).delete()
         print(f"Deleted {num_pdfs_deleted} PDF document records.")
 
+        # FAQs and access grants also reference products
+        num_faqs_deleted = db.query(FAQ).delete()
+        print(f"Deleted {num_faqs_deleted} FAQ records.")
+        db.query(UserProductAccess).delete()
+
         # Delete all products
         num_products_deleted = db.query(Product).delete()
         print(f"Deleted {num_products_deleted} product records.")
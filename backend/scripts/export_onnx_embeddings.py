@@ -0,0 +1,39 @@
+# backend/scripts/export_onnx_embeddings.py
+# Exports the embedding model to ONNX and int8-quantizes it for EMBEDDING_BACKEND=onnx.
+# Needs the optional optimum[onnxruntime] dependency. Usage:
+#   python scripts/export_onnx_embeddings.py [output_dir] [--arm64]
+# then set EMBEDDING_BACKEND=onnx and EMBEDDING_ONNX_DIR=<output_dir> in .env
+import sys
+import os
+
+# Path Setup
+script_dir = os.path.dirname(os.path.abspath(__file__))
+backend_path = os.path.dirname(script_dir)
+sys.path.append(backend_path)
+
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from transformers import AutoTokenizer
+from app.config import settings
+
+def export_and_quantize(output_dir: str, arm64: bool = False):
+    print(f"--- Exporting {settings.EMBEDDING_MODEL} to ONNX ---")
+    model = ORTModelForFeatureExtraction.from_pretrained(settings.EMBEDDING_MODEL, export=True)
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(settings.EMBEDDING_MODEL).save_pretrained(output_dir)
+
+    # Dynamic int8 quantization; AVX-512 VNNI kernels on x86, NEON dot-product on ARM
+    print("--- Quantizing to int8 ---")
+    qconfig = (
+        AutoQuantizationConfig.arm64(is_static=False, per_channel=False) if arm64
+        else AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    )
+    quantizer = ORTQuantizer.from_pretrained(output_dir)
+    # Writes model_quantized.onnx, the default EMBEDDING_ONNX_FILE
+    quantizer.quantize(save_dir=output_dir, quantization_config=qconfig)
+    print(f"Done. Set EMBEDDING_BACKEND=onnx and EMBEDDING_ONNX_DIR={os.path.abspath(output_dir)}")
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    output = args[0] if args else os.path.join(backend_path, "../data/e5-onnx-int8")
+    export_and_quantize(output, arm64="--arm64" in sys.argv)
@@ -26,14 +26,13 @@ def test_pipeline():
     text = processor.extract_text(pdf_path)
     print(f"Extracted {len(text)} characters.")
     
-    chunks = processor.create_chunks(text, {"source": "test.pdf"})
-    print(f"Created {len(chunks)} chunks.")
+    texts, metadatas = processor.create_chunks(text, {"source": "test.pdf"})
+    print(f"Created {len(texts)} chunks.")
     
     # 3. Embed
     print("Generating embeddings (this downloads the model on first run)...")
     embed_service = EmbeddingService()
     
-    texts = [c["text"] for c in chunks]
     embeddings = embed_service.generate_batch_embeddings(texts)
     print(f"Generated {len(embeddings)} vectors.")
     
@@ -41,8 +40,7 @@ def test_pipeline():
     print("Storing in Vector DB...")
     vector_db = VectorDBService()
     
-    ids = [f"{product_id}_{i}" for i in range(len(chunks))]
-    metadatas = [c["metadata"] for c in chunks]
+    ids = [f"{product_id}_{i}" for i in range(len(texts))]
     
     vector_db.add_documents(
         product_id=product_id,